@@ -0,0 +1,146 @@
+r"""Loss parity of mixed-precision (and channels-last) training against
+full-precision training on the normal and spatial SIR benchmarks.
+
+For every benchmark, the test loss of the same initial estimator is
+evaluated in full and in mixed precision. Afterwards, both are trained
+from the same initialization and seed, and their final test losses are
+compared. The script exits with a non-zero status whenever a relative
+deviation exceeds the tolerance. Channels-last kernels are only checked
+when they are enabled explicitly::
+
+    python mixed-precision-parity.py --channels-last --amp-dtype bfloat16
+"""
+
+import argparse
+import hypothesis
+import sys
+import torch
+
+from hypothesis.auto.training import LikelihoodToEvidenceCriterion
+from hypothesis.auto.training import LikelihoodToEvidenceRatioEstimatorTrainer as Trainer
+from hypothesis.nn.amortized_ratio_estimation import LikelihoodToEvidenceRatioEstimatorMLP
+from hypothesis.nn.amortized_ratio_estimation.resnet.base import build_ratio_estimator
+from torch.utils.data import DataLoader
+from torch.utils.data import TensorDataset
+
+
+
+def main(arguments):
+    passed = True
+    for benchmark in arguments.benchmarks:
+        allocate_estimator, dataset_train, dataset_test, batch_size = allocate_benchmark(benchmark, arguments)
+        torch.manual_seed(arguments.seed)
+        initial_state = allocate_estimator().state_dict()
+        losses = {}
+        for precision in ("fp32", "amp"):
+            amp = precision == "amp"
+            estimator = allocate_estimator()
+            estimator.load_state_dict(initial_state)
+            initial_loss = evaluate(estimator, dataset_test, batch_size, amp, arguments)
+            trainer = Trainer(
+                accelerator=hypothesis.accelerator,
+                amp=amp,
+                amp_dtype=allocate_amp_dtype(arguments),
+                batch_size=batch_size,
+                channels_last=amp and arguments.channels_last,
+                dataset_test=dataset_test,
+                dataset_train=dataset_train,
+                epochs=arguments.epochs,
+                estimator=estimator,
+                optimizer=torch.optim.Adam(estimator.parameters()),
+                workers=0)
+            torch.manual_seed(arguments.seed)
+            trainer.fit()
+            losses[precision] = (initial_loss, trainer.losses_test[-1])
+        for index, stage in enumerate(("initial", "trained")):
+            reference = losses["fp32"][index]
+            deviation = abs(losses["amp"][index] - reference) / abs(reference)
+            passed = passed and deviation <= arguments.tolerance
+            print("{} {}: fp32 loss {:.5f}, amp loss {:.5f}, relative deviation {:.4f}".format(
+                benchmark, stage, reference, losses["amp"][index], deviation))
+    # Check if the mixed-precision losses are within the tolerance.
+    if not passed:
+        print("Mixed-precision losses deviate by more than", arguments.tolerance)
+        sys.exit(1)
+
+
+@torch.no_grad()
+def evaluate(estimator, dataset, batch_size, amp, arguments):
+    estimator = estimator.to(hypothesis.accelerator).eval()
+    criterion = LikelihoodToEvidenceCriterion(estimator=estimator, batch_size=batch_size).to(hypothesis.accelerator)
+    device_type = torch.device(hypothesis.accelerator).type
+    loader = DataLoader(dataset, batch_size=batch_size, drop_last=True)
+    # The marginal samples are drawn identically in both precisions.
+    torch.manual_seed(arguments.seed)
+    total_loss = 0.0
+    for inputs, outputs in loader:
+        with torch.autocast(device_type=device_type, dtype=allocate_amp_dtype(arguments), enabled=amp):
+            loss = criterion(inputs=inputs.to(hypothesis.accelerator), outputs=outputs.to(hypothesis.accelerator))
+        total_loss += loss.item()
+
+    return total_loss / len(loader)
+
+
+def allocate_amp_dtype(arguments):
+    if arguments.amp_dtype is None:
+        return None
+    else:
+        return getattr(torch, arguments.amp_dtype)
+
+
+def allocate_benchmark(benchmark, arguments):
+    torch.manual_seed(arguments.seed)
+    if benchmark == "normal":
+        from hypothesis.benchmark.normal import Prior
+        from hypothesis.benchmark.normal import Simulator
+        def allocate_estimator():
+            return LikelihoodToEvidenceRatioEstimatorMLP(shape_inputs=(1,), shape_outputs=(1,))
+        dataset_train = allocate_dataset(Prior(), Simulator(), arguments.normal_train, (1,))
+        dataset_test = allocate_dataset(Prior(), Simulator(), arguments.normal_test, (1,))
+        batch_size = arguments.normal_batch_size
+    else:
+        from hypothesis.benchmark.spatialsir import Prior
+        from hypothesis.benchmark.spatialsir import Simulator
+        shape = (arguments.spatialsir_size, arguments.spatialsir_size)
+        RatioEstimator = build_ratio_estimator({"inputs": (2,), "outputs": shape}, depth=18)
+        def allocate_estimator():
+            return RatioEstimator(channels=3)
+        simulator = Simulator(shape=shape)
+        dataset_train = allocate_dataset(Prior(), simulator, arguments.spatialsir_train, (2,))
+        dataset_test = allocate_dataset(Prior(), simulator, arguments.spatialsir_test, (2,))
+        batch_size = arguments.spatialsir_batch_size
+
+    return allocate_estimator, dataset_train, dataset_test, batch_size
+
+
+@torch.no_grad()
+def allocate_dataset(prior, simulator, n, shape_inputs):
+    inputs = prior.sample(torch.Size([n])).view((-1,) + shape_inputs)
+    outputs = simulator(inputs)
+
+    return TensorDataset(inputs, outputs.view(n, -1) if outputs.dim() <= 2 else outputs)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser("Amortized Likelihood-to-evidence Ratio Estimation: mixed-precision loss parity")
+    parser.add_argument("--amp-dtype", type=str, default=None, choices=["bfloat16", "float16"], help="Mixed-precision data type (default: float16 on GPU, bfloat16 on CPU).")
+    parser.add_argument("--benchmarks", type=str, nargs="+", default=["normal", "spatialsir"], choices=["normal", "spatialsir"], help="Benchmarks to check (default: normal spatialsir).")
+    parser.add_argument("--channels-last", action="store_true", help="Train the mixed-precision estimators with channels-last kernels (default: false).")
+    parser.add_argument("--epochs", type=int, default=2, help="Number of data epochs (default: 2).")
+    parser.add_argument("--normal-batch-size", type=int, default=256, help="Batch size of the normal benchmark (default: 256).")
+    parser.add_argument("--normal-test", type=int, default=4096, help="Number of testing simulations of the normal benchmark (default: 4096).")
+    parser.add_argument("--normal-train", type=int, default=65536, help="Number of training simulations of the normal benchmark (default: 65536).")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0).")
+    parser.add_argument("--spatialsir-batch-size", type=int, default=32, help="Batch size of the spatial SIR benchmark (default: 32).")
+    parser.add_argument("--spatialsir-size", type=int, default=64, help="Lattice size of the spatial SIR benchmark (default: 64).")
+    parser.add_argument("--spatialsir-test", type=int, default=128, help="Number of testing simulations of the spatial SIR benchmark (default: 128).")
+    parser.add_argument("--spatialsir-train", type=int, default=512, help="Number of training simulations of the spatial SIR benchmark (default: 512).")
+    parser.add_argument("--tolerance", type=float, default=0.05, help="Maximum relative deviation of the losses (default: 0.05).")
+    arguments, _ = parser.parse_known_args()
+
+    return arguments
+
+
+if __name__ == "__main__":
+    arguments = parse_arguments()
+    main(arguments)
@@ -1,6 +1,8 @@
 from .base import BaseTrainer
 from .amortized_ratio_estimation import BaseAmortizedRatioEstimatorTrainer
+from .amortized_ratio_estimation import DistillationTrainer
 from .amortized_ratio_estimation import LikelihoodToEvidenceRatioEstimatorTrainer
 from .amortized_ratio_estimation import LikelihoodToEvidenceCriterion
 from .amortized_ratio_estimation import ConservativeLikelihoodToEvidenceCriterion
 from .amortized_ratio_estimation import create_trainer
+from .online import SimulationStream
@@ -5,10 +5,19 @@ import re
 import torch
 
 from .base import BaseTrainer
+from .util import CheckpointWriter
+from .util import all_reduce_mean
+from .util import allocate_state_dict_buffer
+from .util import copy_state_dict
+from .util import snapshot
 from hypothesis.nn.amortized_ratio_estimation import BaseCriterion
 from hypothesis.nn.amortized_ratio_estimation import ConservativeLikelihoodToEvidenceCriterion
+from hypothesis.nn.amortized_ratio_estimation import DistillationCriterion
 from hypothesis.nn.amortized_ratio_estimation import LikelihoodToEvidenceCriterion
+from hypothesis.nn.util import to_channels_last
 from hypothesis.summary import TrainingSummary as Summary
+from hypothesis.util.general import rng_state
+from hypothesis.util.general import set_rng_state
 
 
 
@@ -21,8 +30,13 @@ class BaseAmortizedRatioEstimatorTrainer(BaseTrainer):
         optimizer,
         dataset_train,
         accelerator=hypothesis.accelerator,
+        amp=False,
+        amp_dtype=None,
         batch_size=hypothesis.default.batch_size,
+        best_model_on_device=False,
+        channels_last=False,
         checkpoint=None,
+        checkpoint_every=None,
         dataset_test=None,
         epochs=hypothesis.default.epochs,
         identifier=None,
@@ -33,6 +47,7 @@ class BaseAmortizedRatioEstimatorTrainer(BaseTrainer):
         super(BaseAmortizedRatioEstimatorTrainer, self).__init__(
             batch_size=batch_size,
             checkpoint=checkpoint,
+            checkpoint_every=checkpoint_every,
             epochs=epochs,
             identifier=identifier,
             shuffle=shuffle,
@@ -42,8 +57,11 @@ class BaseAmortizedRatioEstimatorTrainer(BaseTrainer):
         self.dataset_test = dataset_test
         # Trainer state
         self.accelerator = accelerator
+        self.checkpoint_writer = CheckpointWriter()
         self.criterion = criterion
+        self.current_batch = 0
         self.current_epoch = 0
+        self.epoch_seed = 0
         self.epochs_remaining = self.epochs
         self.estimator = estimator
         self.feeder = feeder
@@ -55,9 +73,44 @@ class BaseAmortizedRatioEstimatorTrainer(BaseTrainer):
         self.best_epoch = None
         self.best_loss = float("infinity")
         self.best_model = None
+        self.best_model_on_device = best_model_on_device
         # Move estimator and criterion to the specified accelerator.
         self.estimator = self.estimator.to(self.accelerator)
         self.criterion = self.criterion.to(self.accelerator)
+        # Check if the convolutional kernels have to be stored channels-last.
+        if channels_last:
+            self.estimator = to_channels_last(self.estimator)
+        # Check if the gradients have to be synchronized between ranks. The
+        # criterion is wrapped as it evaluates the estimator several times
+        # per step, whereas DDP expects a single forward pass per backward.
+        if self.world_size > 1:
+            self.criterion = self._allocate_distributed_criterion()
+        # Automatic mixed precision
+        self.amp = amp
+        self.amp_device = torch.device(self.accelerator).type
+        if amp_dtype is None:
+            amp_dtype = torch.float16 if self.amp_device == "cuda" else torch.bfloat16
+        self.amp_dtype = amp_dtype
+        # Gradient scaling is only required for half-precision floats.
+        self.scaler = torch.amp.GradScaler(self.amp_device,
+            enabled=(self.amp and self.amp_dtype == torch.float16))
+        # Load the previously saved state.
+        self._checkpoint_load()
+
+    def _allocate_distributed_criterion(self):
+        device = torch.device(self.accelerator)
+        if device.type == "cuda":
+            device_ids = [device.index]
+        else:
+            device_ids = None
+
+        return torch.nn.parallel.DistributedDataParallel(self.criterion, device_ids=device_ids)
+
+    def _autocast(self):
+        return torch.autocast(
+            device_type=self.amp_device,
+            dtype=self.amp_dtype,
+            enabled=self.amp)
 
     def _register_events(self):
         self.register_event("batch_complete")
@@ -73,11 +126,15 @@ class BaseAmortizedRatioEstimatorTrainer(BaseTrainer):
 
     @torch.no_grad()
     def _checkpoint_store(self):
-        if self._valid_checkpoint_path():
+        # Only the first rank stores checkpoints, as all ranks share the state.
+        if self._valid_checkpoint_path() and self.rank == 0:
+            self._synchronize() # Pending copies to the best model.
             state = {}
             state["accelerator"] = self.accelerator
+            state["current_batch"] = self.current_batch
             state["current_epoch"] = self.current_epoch
-            state["estimator"] = self._cpu_estimator_state_dict()
+            state["epoch_seed"] = self.epoch_seed
+            state["estimator"] = self._estimator_module().state_dict()
             state["epochs_remaining"] = self.epochs_remaining
             state["epochs"] = self.epochs
             state["losses_test"] = self.losses_test
@@ -87,19 +144,49 @@ class BaseAmortizedRatioEstimatorTrainer(BaseTrainer):
             if self.lr_scheduler_epoch is not None:
                 state["lr_scheduler_epoch"] = self.lr_scheduler_epoch.state_dict()
             state["optimizer"] = self.optimizer.state_dict()
+            state["scaler"] = self.scaler.state_dict()
             state["best_epoch"] = self.best_epoch
             state["best_loss"] = self.best_loss
             state["best_model"] = self.best_model
-            torch.save(state, self.checkpoint_path)
+            state["rng"] = rng_state()
+            # Serialize a snapshot of the state while training proceeds.
+            self.checkpoint_writer.write(snapshot(state), self.checkpoint_path)
 
+    @torch.no_grad()
     def _checkpoint_load(self):
         if self._valid_checkpoint_path_and_exists():
-            raise NotImplementedError
+            state = torch.load(self.checkpoint_path, map_location="cpu", weights_only=False)
+            self.current_batch = state["current_batch"]
+            self.current_epoch = state["current_epoch"]
+            self.epoch_seed = state["epoch_seed"]
+            self._estimator_module().load_state_dict(state["estimator"])
+            self.epochs_remaining = state["epochs_remaining"]
+            self.epochs = state["epochs"]
+            self.losses_test = state["losses_test"]
+            self.losses_train = state["losses_train"]
+            if self.lr_scheduler_update is not None:
+                self.lr_scheduler_update.load_state_dict(state["lr_scheduler_update"])
+            if self.lr_scheduler_epoch is not None:
+                self.lr_scheduler_epoch.load_state_dict(state["lr_scheduler_epoch"])
+            self.optimizer.load_state_dict(state["optimizer"])
+            self.scaler.load_state_dict(state["scaler"])
+            self.best_epoch = state["best_epoch"]
+            self.best_loss = state["best_loss"]
+            if state["best_model"] is not None:
+                self._store_best_model(state["best_model"])
+            set_rng_state(state["rng"])
+
+    def _estimator_module(self):
+        # Check if we're training a Data Parallel model.
+        if isinstance(self.estimator, (torch.nn.DataParallel, torch.nn.parallel.DistributedDataParallel)):
+            return self.estimator.module
+        else:
+            return self.estimator
 
     def _summarize(self):
         return Summary(
             identifier=self.identifier,
-            model_best=self.best_model,
+            model_best=self._best_model_state_dict(),
             model_final=self._cpu_estimator_state_dict(),
             epoch_best=self.best_epoch,
             epochs=self.epochs,
@@ -108,23 +195,55 @@ class BaseAmortizedRatioEstimatorTrainer(BaseTrainer):
 
     @torch.no_grad()
     def _cpu_estimator_state_dict(self):
-        # Check if we're training a Data Parallel model.
-        self.estimator = self.estimator.cpu()
-        if isinstance(self.estimator, torch.nn.DataParallel):
-            state_dict = self.estimator.module.state_dict()
+        return snapshot(self._estimator_module().state_dict())
+
+    @torch.no_grad()
+    def _store_best_model(self, state_dict=None):
+        if state_dict is None:
+            state_dict = self._estimator_module().state_dict()
+        # Allocate the buffer of the best model once.
+        if self.best_model is None:
+            if self.best_model_on_device:
+                device = self.accelerator
+            else:
+                device = "cpu"
+            self.best_model = allocate_state_dict_buffer(state_dict, device=device)
+        copy_state_dict(state_dict, self.best_model)
+
+    def _best_model_state_dict(self):
+        if self.best_model is None:
+            return None
+        self._synchronize()
+
+        return snapshot(self.best_model)
+
+    def _allocate_epoch_seed(self):
+        seed = torch.randint(2 ** 62, (1,))
+        # All ranks share the permutation of the epoch.
+        if self.world_size > 1:
+            seed = seed.to(self._reduction_device())
+            torch.distributed.broadcast(seed, src=0)
+
+        return int(seed.item())
+
+    def _reduction_device(self):
+        # The NCCL backend only reduces device tensors.
+        if self.world_size > 1 and torch.distributed.get_backend() == "nccl":
+            return self.accelerator
         else:
-            state_dict = self.estimator.state_dict()
-        self.estimator = self.estimator.to(hypothesis.accelerator)
+            return "cpu"
 
-        return state_dict
+    def _synchronize(self):
+        if torch.device(self.accelerator).type == "cuda":
+            torch.cuda.synchronize(self.accelerator)
 
     @torch.no_grad()
     def checkpoint(self):
         self._checkpoint_store()
 
     def fit(self):
-        # Training procedure
-        for epoch in range(self.epochs):
+        # Training procedure, resumes at the first incomplete epoch.
+        for epoch in range(self.epochs - self.epochs_remaining, self.epochs):
             self.current_epoch = epoch + 1
             self.call_event(self.events.epoch_start)
             self.train()
@@ -132,7 +251,7 @@ class BaseAmortizedRatioEstimatorTrainer(BaseTrainer):
             if self.dataset_test is not None and len(self.dataset_test) > 0:
                 loss = self.test()
             else:
-                self.best_model = self._cpu_estimator_state_dict()
+                self._store_best_model()
             # Check if a learning rate scheduler has been allocated.
             if self.lr_scheduler_epoch is not None:
                 self.lr_scheduler_epoch.step(loss)
@@ -140,7 +259,8 @@ class BaseAmortizedRatioEstimatorTrainer(BaseTrainer):
             self.checkpoint()
             self.call_event(self.events.epoch_complete)
         # Remove the checkpoint.
-        if self._valid_checkpoint_path_and_exists():
+        self.checkpoint_writer.wait()
+        if self._valid_checkpoint_path_and_exists() and self.rank == 0:
             os.remove(self.checkpoint_path)
 
         return self._summarize()
@@ -151,38 +271,51 @@ class BaseAmortizedRatioEstimatorTrainer(BaseTrainer):
         loader = self._allocate_data_loader(self.dataset_test)
         total_loss = 0.0
         for batch in loader:
-            loss = self.feeder(
-                accelerator=self.accelerator,
-                batch=batch,
-                criterion=self.criterion)
+            with self._autocast():
+                loss = self.feeder(
+                    accelerator=self.accelerator,
+                    batch=batch,
+                    criterion=self.criterion)
             total_loss += loss.item()
         total_loss /= len(loader)
+        total_loss = all_reduce_mean(total_loss, self.world_size, self._reduction_device())
         self.losses_test.append(total_loss)
         if total_loss < self.best_loss:
-            state_dict = self._cpu_estimator_state_dict()
+            self._store_best_model()
             self.best_loss = total_loss
-            self.best_model = state_dict
             self.best_epoch = self.current_epoch
 
         return total_loss
 
     def train(self):
         self.estimator.train()
-        loader = self._allocate_data_loader(self.dataset_train)
-        for index, batch in enumerate(loader):
+        # Check if a new epoch is started, or an interrupted epoch resumed.
+        if self.current_batch == 0:
+            self.epoch_seed = self._allocate_epoch_seed()
+        loader = self._allocate_data_loader(self.dataset_train,
+            seed=self.epoch_seed,
+            skip=self.current_batch)
+        for index, batch in enumerate(loader, start=self.current_batch):
             self.call_event(self.events.batch_start)
-            loss = self.feeder(
-                accelerator=self.accelerator,
-                batch=batch,
-                criterion=self.criterion)
+            with self._autocast():
+                loss = self.feeder(
+                    accelerator=self.accelerator,
+                    batch=batch,
+                    criterion=self.criterion)
             self.optimizer.zero_grad()
-            loss.backward()
-            self.optimizer.step()
+            self.scaler.scale(loss).backward()
+            self.scaler.step(self.optimizer)
+            self.scaler.update()
             if self.lr_scheduler_update is not None:
                 self.lr_scheduler_update.step()
-            loss = loss.item()
+            loss = all_reduce_mean(loss.item(), self.world_size, self._reduction_device())
             self.losses_train.append(loss)
+            self.current_batch = index + 1
+            # Check if an intermediate checkpoint has to be stored.
+            if self.checkpoint_every is not None and self.current_batch % self.checkpoint_every == 0:
+                self.checkpoint()
             self.call_event(self.events.batch_complete, index=index, loss=loss)
+        self.current_batch = 0
 
 
 
@@ -193,9 +326,14 @@ class LikelihoodToEvidenceRatioEstimatorTrainer(BaseAmortizedRatioEstimatorTrain
         optimizer,
         dataset_train,
         accelerator=hypothesis.accelerator,
+        amp=False,
+        amp_dtype=None,
         batch_size=hypothesis.default.batch_size,
+        best_model_on_device=False,
+        channels_last=False,
         criterion=None,
         checkpoint=None,
+        checkpoint_every=None,
         dataset_test=None,
         epochs=hypothesis.default.epochs,
         identifier=None,
@@ -209,8 +347,13 @@ class LikelihoodToEvidenceRatioEstimatorTrainer(BaseAmortizedRatioEstimatorTrain
         feeder = LikelihoodToEvidenceRatioEstimatorTrainer.feeder
         super(LikelihoodToEvidenceRatioEstimatorTrainer, self).__init__(
             accelerator=accelerator,
+            amp=amp,
+            amp_dtype=amp_dtype,
             batch_size=batch_size,
+            best_model_on_device=best_model_on_device,
+            channels_last=channels_last,
             checkpoint=checkpoint,
+            checkpoint_every=checkpoint_every,
             criterion=criterion,
             dataset_test=dataset_test,
             dataset_train=dataset_train,
@@ -233,6 +376,63 @@ class LikelihoodToEvidenceRatioEstimatorTrainer(BaseAmortizedRatioEstimatorTrain
 
 
 
+class DistillationTrainer(BaseAmortizedRatioEstimatorTrainer):
+    r"""Trains a ``DistilledRatioEstimator`` on a dataset of inputs,
+    features and log ratios of the teacher, see
+    ``hypothesis.nn.amortized_ratio_estimation.distillation``."""
+
+    def __init__(self,
+        estimator,
+        optimizer,
+        dataset_train,
+        accelerator=hypothesis.accelerator,
+        amp=False,
+        amp_dtype=None,
+        batch_size=hypothesis.default.batch_size,
+        best_model_on_device=False,
+        criterion=None,
+        checkpoint=None,
+        checkpoint_every=None,
+        dataset_test=None,
+        epochs=hypothesis.default.epochs,
+        identifier=None,
+        lr_scheduler_epoch=None,
+        lr_scheduler_update=None,
+        workers=hypothesis.default.dataloader_workers):
+        if criterion is None:
+            criterion = DistillationCriterion(estimator=estimator)
+        feeder = DistillationTrainer.feeder
+        super(DistillationTrainer, self).__init__(
+            accelerator=accelerator,
+            amp=amp,
+            amp_dtype=amp_dtype,
+            batch_size=batch_size,
+            best_model_on_device=best_model_on_device,
+            checkpoint=checkpoint,
+            checkpoint_every=checkpoint_every,
+            criterion=criterion,
+            dataset_test=dataset_test,
+            dataset_train=dataset_train,
+            epochs=epochs,
+            estimator=estimator,
+            feeder=feeder,
+            identifier=identifier,
+            lr_scheduler_epoch=lr_scheduler_epoch,
+            lr_scheduler_update=lr_scheduler_update,
+            optimizer=optimizer,
+            workers=workers)
+
+    @staticmethod
+    def feeder(batch, criterion, accelerator):
+        inputs, features, log_ratios = batch
+        inputs = inputs.to(accelerator, non_blocking=True)
+        features = features.to(accelerator, non_blocking=True)
+        log_ratios = log_ratios.to(accelerator, non_blocking=True)
+
+        return criterion(inputs=inputs, features=features, log_ratios=log_ratios)
+
+
+
 def create_trainer(criterion, denominator):
     r"""Variables of the dataset must by sorted by variable name."""
     variables = re.split(",|\|", denominator)
@@ -257,8 +457,13 @@ def create_trainer(criterion, denominator):
             dataset_train,
             criterion,
             accelerator=hypothesis.accelerator,
+            amp=False,
+            amp_dtype=None,
             batch_size=hypothesis.default.batch_size,
+            best_model_on_device=False,
+            channels_last=False,
             checkpoint=None,
+            checkpoint_every=None,
             dataset_test=None,
             epochs=hypothesis.default.epochs,
             lr_scheduler=None,
@@ -267,8 +472,13 @@ def create_trainer(criterion, denominator):
             workers=hypothesis.default.dataloader_workers):
             super(Trainer, self).__init__(
                 accelerator=accelerator,
+                amp=amp,
+                amp_dtype=amp_dtype,
                 batch_size=batch_size,
+                best_model_on_device=best_model_on_device,
+                channels_last=channels_last,
                 checkpoint=checkpoint,
+                checkpoint_every=checkpoint_every,
                 criterion=criterion,
                 dataset_test=dataset_test,
                 dataset_train=dataset_train,
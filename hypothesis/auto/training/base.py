@@ -1,7 +1,13 @@
 import hypothesis
+import torch
 
+from .online import SimulationStream
+from .util import BatchDataset
+from .util import BatchSampler
 from hypothesis.engine import Procedure
+from hypothesis.util.general import distributed_rank_and_world_size
 from torch.utils.data import DataLoader
+from torch.utils.data import IterableDataset
 
 
 
@@ -10,6 +16,7 @@ class BaseTrainer(Procedure):
     def __init__(self,
         batch_size=hypothesis.default.batch_size,
         checkpoint=None,
+        checkpoint_every=None,
         epochs=hypothesis.default.epochs,
         identifier=None,
         shuffle=True,
@@ -17,13 +24,15 @@ class BaseTrainer(Procedure):
         super(BaseTrainer, self).__init__()
         # Training hyperparameters
         self.batch_size = batch_size
+        self.checkpoint_every = checkpoint_every
         self.checkpoint_path = checkpoint
         self.dataloader_workers = workers
         self.epochs = epochs
         self.identifier = identifier
+        self.iterable_loaders = {}
         self.shuffle = shuffle
-        # Load the previously saved state.
-        self._checkpoint_load()
+        # Distributed training
+        self.rank, self.world_size = distributed_rank_and_world_size()
 
     def _checkpoint_store(self):
         raise NotImplementedError
@@ -31,13 +40,55 @@ class BaseTrainer(Procedure):
     def _checkpoint_load(self):
         raise NotImplementedError
 
-    def _allocate_data_loader(self, dataset):
-        return DataLoader(dataset,
+    def _allocate_data_loader(self, dataset, seed=0, skip=0):
+        # Check if the dataset is a stream of simulated batches.
+        if isinstance(dataset, SimulationStream):
+            return dataset
+        # Check if the dataset yields complete batches by itself.
+        if isinstance(dataset, IterableDataset):
+            return self._allocate_iterable_data_loader(dataset)
+        # Check if the dataset is able to retrieve complete batches.
+        batched = hasattr(dataset, "get_batch")
+        sampler = BatchSampler(len(dataset),
             batch_size=self.batch_size,
-            drop_last=True,
-            num_workers=self.dataloader_workers,
-            pin_memory=True,
-            shuffle=self.shuffle)
+            seed=seed,
+            shuffle=self.shuffle,
+            skip=skip,
+            sort=batched,
+            rank=self.rank,
+            world_size=self.world_size)
+        # Seeds the workers without consuming the global random state.
+        generator = torch.Generator()
+        generator.manual_seed(seed)
+        if batched:
+            loader = DataLoader(BatchDataset(dataset),
+                batch_size=None,
+                generator=generator,
+                num_workers=self.dataloader_workers,
+                pin_memory=True,
+                sampler=sampler)
+        else:
+            loader = DataLoader(dataset,
+                batch_sampler=sampler,
+                generator=generator,
+                num_workers=self.dataloader_workers,
+                pin_memory=True)
+
+        return loader
+
+    def _allocate_iterable_data_loader(self, dataset):
+        # Workers persist across epochs, as they may hold state (e.g.,
+        # replay buffers). Interrupted epochs are not resumed, a resumed
+        # epoch consists of new batches.
+        key = id(dataset)
+        if key not in self.iterable_loaders.keys():
+            self.iterable_loaders[key] = DataLoader(dataset,
+                batch_size=None,
+                num_workers=self.dataloader_workers,
+                persistent_workers=self.dataloader_workers > 0,
+                pin_memory=True)
+
+        return self.iterable_loaders[key]
 
     def _register_events(self):
         raise NotImplementedError
@@ -0,0 +1,232 @@
+r"""Online training on a continuous stream of simulations.
+
+A pool of simulator processes fills a bounded ring of batches in shared
+memory, while the trainer consumes them. Slots of the ring cycle between
+a queue of free slots and a queue of filled slots, such that batches are
+never copied between processes.
+
+Example usage::
+
+    stream = SimulationStream(simulator, prior, batch_size=256, workers=4)
+    trainer = LikelihoodToEvidenceRatioEstimatorTrainer(
+        estimator=estimator,
+        optimizer=optimizer,
+        dataset_train=stream,
+        batch_size=256)
+    trainer.fit()
+    print(stream.statistics())
+    stream.close()
+"""
+
+import hypothesis
+import numpy as np
+import queue
+import random
+import time
+import torch
+import torch.multiprocessing as mp
+
+from hypothesis.simulation.util import sample_joint
+
+
+
+class SimulationStream:
+    r"""Bounded shared-memory ring of simulated ``(inputs, outputs)``
+    batches, filled by a pool of simulator processes.
+
+    The stream reports the throughput of the simulators and the trainer
+    and the time either side spends waiting on the other, see
+    ``statistics``. If ``autoscale`` is set, simulator processes are
+    added while the trainer is starved, and removed while the ring is
+    full, within ``[min_workers, max_workers]``.
+
+    :param simulator: The (batched) simulator.
+    :param prior: The prior from which the inputs are drawn.
+    :param batch_size: Number of simulations per batch, should match the
+                       batch size of the trainer.
+    :param batches: Number of batches per epoch.
+    :param slots: Number of batches in the ring.
+    :param workers: Initial number of simulator processes.
+    :param autoscale: Adjusts the number of simulator processes.
+    :param adjust_every: Number of consumed batches between adjustments.
+    :param seed: Seed from which the seeds of the simulators are derived.
+    """
+
+    def __init__(self, simulator, prior,
+        batch_size=hypothesis.default.batch_size,
+        batches=1000,
+        slots=16,
+        workers=hypothesis.default.dataloader_workers,
+        autoscale=False,
+        adjust_every=100,
+        max_workers=None,
+        min_workers=1,
+        seed=0):
+        super(SimulationStream, self).__init__()
+        if max_workers is None:
+            max_workers = max(workers, mp.cpu_count())
+        self.adjust_every = adjust_every
+        self.autoscale = autoscale
+        self.batch_size = batch_size
+        self.batches = batches
+        self.context = mp.get_context()
+        self.max_workers = max_workers
+        self.min_workers = min_workers
+        self.prior = prior
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.simulator = simulator
+        self.stopping = []
+        self.workers = []
+        # Allocate the ring from the shapes of a probe simulation.
+        inputs, outputs = _probe(simulator, prior, batch_size)
+        self.inputs = torch.empty((slots,) + tuple(inputs.shape), dtype=inputs.dtype).share_memory_()
+        self.outputs = torch.empty((slots,) + tuple(outputs.shape), dtype=outputs.dtype).share_memory_()
+        self.free = self.context.Queue()
+        self.filled = self.context.Queue()
+        for slot in range(slots):
+            self.free.put(slot)
+        # Throughput metrics.
+        self.consumed = 0
+        self.consumer_wait = 0.0
+        self.producer_wait = self.context.Value("d", 0.0)
+        self.simulations = self.context.Value("l", 0)
+        self.start = time.time()
+        self.window = self._counters()
+        for _ in range(workers):
+            self.add_worker()
+
+    def _counters(self):
+        return {
+            "consumed": self.consumed,
+            "consumer_wait": self.consumer_wait,
+            "producer_wait": self.producer_wait.value,
+            "simulations": self.simulations.value,
+            "time": time.time(),
+            "workers": len(self.workers)}
+
+    def add_worker(self):
+        seed = int(self.seed_sequence.spawn(1)[0].generate_state(1)[0])
+        stop = self.context.Event()
+        process = self.context.Process(target=_produce, daemon=True, args=(
+            self.simulator, self.prior, self.batch_size,
+            self.inputs, self.outputs, self.free, self.filled,
+            stop, seed, self.simulations, self.producer_wait))
+        process.start()
+        self.workers.append((process, stop))
+
+    def remove_worker(self):
+        r"""Signals a simulator process to stop. The process completes its
+        current batch, and is joined once it has exited."""
+        process, stop = self.workers.pop()
+        stop.set()
+        self.stopping.append(process)
+
+    def _reap(self):
+        for process in [p for p in self.stopping if not p.is_alive()]:
+            process.join()
+            self.stopping.remove(process)
+
+    def adjust(self):
+        r"""Adjusts the number of simulator processes to the throughput of
+        the trainer, based on the waiting times since the previous
+        adjustment."""
+        self._reap()
+        counters = self._counters()
+        elapsed = counters["time"] - self.window["time"]
+        if elapsed <= 0 or len(self.workers) == 0:
+            return
+        consumer_waiting = (counters["consumer_wait"] - self.window["consumer_wait"]) / elapsed
+        producer_waiting = (counters["producer_wait"] - self.window["producer_wait"]) / (elapsed * len(self.workers))
+        # Check if the trainer is starved, or the ring is full.
+        if consumer_waiting > 0.1 and len(self.workers) < self.max_workers:
+            self.add_worker()
+        elif producer_waiting > 0.5 and len(self.workers) > self.min_workers:
+            self.remove_worker()
+        self.window = self._counters()
+
+    def close(self):
+        while len(self.workers) > 0:
+            self.remove_worker()
+        for process in self.stopping:
+            process.join()
+        self.stopping = []
+
+    def statistics(self):
+        r"""Throughput (samples per second) of the simulators and the
+        trainer, and the fraction of time both sides spend waiting."""
+        elapsed = time.time() - self.start
+        consumer_waiting = self.consumer_wait / elapsed
+        if consumer_waiting > 0.1:
+            bound = "simulation"
+        else:
+            bound = "compute"
+
+        return {
+            "bound": bound,
+            "consumer_waiting": consumer_waiting,
+            "simulation_throughput": self.simulations.value / elapsed,
+            "training_throughput": self.consumed / elapsed,
+            "workers": len(self.workers)}
+
+    def __del__(self):
+        if hasattr(self, "workers"):
+            self.close()
+
+    def __iter__(self):
+        slot = None
+        try:
+            for index in range(self.batches):
+                start = time.time()
+                slot = self.filled.get()
+                self.consumer_wait += time.time() - start
+                self.consumed += self.batch_size
+                # The slot is released once the next batch is requested.
+                yield self.inputs[slot], self.outputs[slot]
+                self.free.put(slot)
+                slot = None
+                if self.autoscale and (index + 1) % self.adjust_every == 0:
+                    self.adjust()
+        finally:
+            if slot is not None:
+                self.free.put(slot)
+
+    def __len__(self):
+        return self.batches
+
+
+
+def _probe(simulator, prior, batch_size):
+    # Simulate without affecting the global random state.
+    numpy_state = np.random.get_state()
+    python_state = random.getstate()
+    devices = list(range(torch.cuda.device_count())) if torch.cuda.is_available() else []
+    try:
+        with torch.random.fork_rng(devices=devices), torch.no_grad():
+            return sample_joint(simulator, prior, n=batch_size)
+    finally:
+        np.random.set_state(numpy_state)
+        random.setstate(python_state)
+
+
+def _produce(simulator, prior, batch_size, inputs, outputs, free, filled, stop, seed, simulations, waiting):
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+    torch.set_num_threads(1) # Parallelism is provided by the processes.
+    while not stop.is_set():
+        start = time.time()
+        try:
+            slot = free.get(timeout=0.1)
+        except queue.Empty:
+            slot = None
+        with waiting.get_lock():
+            waiting.value += time.time() - start
+        if slot is None:
+            continue
+        with torch.no_grad():
+            batch_inputs, batch_outputs = sample_joint(simulator, prior, n=batch_size)
+        inputs[slot].copy_(batch_inputs.view_as(inputs[slot]))
+        outputs[slot].copy_(batch_outputs.view_as(outputs[slot]))
+        filled.put(slot)
+        with simulations.get_lock():
+            simulations.value += batch_size
@@ -1 +1,163 @@
+import os
+import threading
 import torch
+
+from torch.utils.data import Dataset
+from torch.utils.data import Sampler
+
+
+class BatchSampler(Sampler):
+    r"""Yields the indices of every batch in a data epoch.
+
+    The permutation of an epoch is fully determined by ``seed``, which
+    allows an interrupted epoch to be resumed by skipping the batches
+    which have already been processed. If ``sort`` is set, the indices
+    within a batch are sorted to improve the locality of storage reads.
+
+    In distributed training, every rank draws the same permutation and
+    retrieves every ``world_size``-th batch, starting at batch ``rank``.
+    All ranks process the same number of batches.
+    """
+
+    def __init__(self, size, batch_size, seed=0, shuffle=True, skip=0, sort=False, rank=0, world_size=1):
+        super(BatchSampler, self).__init__()
+        self.batch_size = batch_size
+        self.rank = rank
+        self.seed = seed
+        self.shuffle = shuffle
+        self.size = size
+        self.skip = skip
+        self.sort = sort
+        self.world_size = world_size
+
+    def _indices(self):
+        if self.shuffle:
+            generator = torch.Generator()
+            generator.manual_seed(self.seed)
+            indices = torch.randperm(self.size, generator=generator)
+        else:
+            indices = torch.arange(self.size)
+
+        return indices
+
+    def __iter__(self):
+        indices = self._indices()
+        for index in range(self.skip, self.num_batches()):
+            base = (index * self.world_size + self.rank) * self.batch_size
+            batch = indices[base:base + self.batch_size]
+            if self.sort:
+                batch, _ = batch.sort()
+            yield batch.tolist()
+
+    def __len__(self):
+        return self.num_batches() - self.skip
+
+    def num_batches(self):
+        r"""Number of batches of the rank, drops the last incomplete batch."""
+        return self.size // self.batch_size // self.world_size
+
+
+class BatchDataset(Dataset):
+    r"""Exposes a dataset implementing ``get_batch`` to a data loader
+    which retrieves complete batches (``batch_size=None``)."""
+
+    def __init__(self, dataset):
+        super(BatchDataset, self).__init__()
+        self.dataset = dataset
+
+    def __getitem__(self, indices):
+        return self.dataset.get_batch(indices)
+
+    def __len__(self):
+        return len(self.dataset)
+
+
+class CheckpointWriter:
+    r"""Writes checkpoints atomically on a background thread.
+
+    At most a single write is in flight. The state is expected to be a
+    snapshot (see ``snapshot``), i.e., it should not alias any tensor
+    which is modified by the training procedure. A failed write is raised
+    by the next call to ``wait`` or ``write``.
+    """
+
+    def __init__(self):
+        self.error = None
+        self.thread = None
+
+    def _write(self, state, path):
+        temporary_path = path + ".tmp"
+        try:
+            torch.save(state, temporary_path)
+            os.replace(temporary_path, path)
+        except BaseException as e:
+            self.error = e
+            # Check if a partially written checkpoint has to be removed.
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
+    def write(self, state, path):
+        self.wait()
+        self.thread = threading.Thread(target=self._write, args=(state, path))
+        self.thread.start()
+
+    def wait(self):
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        # Check if the previous write failed.
+        if self.error is not None:
+            error = self.error
+            self.error = None
+            raise error
+
+
+def allocate_state_dict_buffer(state_dict, device="cpu"):
+    r"""Allocates tensors matching the specified state dictionary.
+
+    Host buffers are allocated in page-locked memory whenever CUDA is
+    available, which allows for asynchronous device-to-host copies.
+    """
+    device = torch.device(device)
+    pin_memory = device.type == "cpu" and torch.cuda.is_available()
+    buffer = type(state_dict)()
+    for k, v in state_dict.items():
+        buffer[k] = torch.empty(v.shape, dtype=v.dtype, device=device, pin_memory=pin_memory)
+
+    return buffer
+
+
+@torch.no_grad()
+def copy_state_dict(source, destination):
+    r"""Copies the source state dictionary into a preallocated buffer.
+
+    Note:
+        Copies to page-locked host memory are asynchronous, the device has
+        to be synchronized before the buffer is read.
+    """
+    for k, v in source.items():
+        destination[k].copy_(v, non_blocking=True)
+
+
+@torch.no_grad()
+def snapshot(state):
+    r"""Recursively copies the tensors in the specified state to the CPU."""
+    if isinstance(state, torch.Tensor):
+        return state.detach().to("cpu", copy=True)
+    elif isinstance(state, dict):
+        return type(state)((k, snapshot(v)) for k, v in state.items())
+    elif isinstance(state, (list, tuple)):
+        return type(state)(snapshot(v) for v in state)
+    else:
+        return state
+
+
+@torch.no_grad()
+def all_reduce_mean(value, world_size=1, device="cpu"):
+    r"""Averages the specified scalar over all ranks."""
+    if world_size == 1:
+        return value
+    tensor = torch.tensor([value], dtype=torch.float64, device=device)
+    torch.distributed.all_reduce(tensor, op=torch.distributed.ReduceOp.SUM)
+
+    return tensor.item() / world_size
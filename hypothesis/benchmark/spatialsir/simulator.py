@@ -25,9 +25,9 @@ class SpatialSIRSimulator(BaseSimulator):
         beta = theta[0].item()  # Infection rate
         gamma = theta[1].item() # Recovery rate
         # Allocate the data grids.
-        infected = np.zeros(self.lattice_shape, dtype=np.int)
-        recovered = np.zeros(self.lattice_shape, dtype=np.int)
-        kernel = np.ones((3, 3), dtype=np.int)
+        infected = np.zeros(self.lattice_shape, dtype=int)
+        recovered = np.zeros(self.lattice_shape, dtype=int)
+        kernel = np.ones((3, 3), dtype=int)
         # Seed the grid with the initial infections.
         num_initial_infections = self._sample_num_initial_infections()
         for _ in range(num_initial_infections):
@@ -44,12 +44,12 @@ class SpatialSIRSimulator(BaseSimulator):
             potential = signal.convolve2d(infected, kernel, mode="same")
             potential *= susceptible
             potential = potential * beta / 8
-            next_infected = ((potential > np.random.uniform(size=self.lattice_shape)).astype(np.int) + infected) * (1 - recovered)
-            next_infected = (next_infected >= 1).astype(np.int)
+            next_infected = ((potential > np.random.uniform(size=self.lattice_shape)).astype(int) + infected) * (1 - recovered)
+            next_infected = (next_infected >= 1).astype(int)
             # Recover
             potential = infected * gamma
-            next_recovered = (potential > np.random.uniform(size=self.lattice_shape)).astype(np.int) + recovered
-            next_recovered = (next_recovered >= 1).astype(np.int)
+            next_recovered = (potential > np.random.uniform(size=self.lattice_shape)).astype(int) + recovered
+            next_recovered = (next_recovered >= 1).astype(int)
             # Next parameters
             recovered = next_recovered
             infected = next_infected
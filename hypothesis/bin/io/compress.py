@@ -0,0 +1,48 @@
+r"""A utility program to compress data files into chunks.
+
+Converts a numpy data file into the chunked and compressed ``.npc`` format,
+which can be read directly by ``hypothesis.util.data.numpy.Dataset``.
+"""
+
+import argparse
+import numpy as np
+import os
+
+from hypothesis.util.data.numpy.chunked import codecs
+from hypothesis.util.data.numpy.chunked import compress
+
+
+
+def main(arguments):
+    compress(arguments.in_file, arguments.out_file,
+        storage_dtype=arguments.storage_dtype,
+        codec=arguments.codec,
+        chunk_size=arguments.chunk_size,
+        level=arguments.level)
+    original_size = os.path.getsize(arguments.in_file)
+    compressed_size = os.path.getsize(arguments.out_file)
+    print("Compressed", original_size, "bytes into", compressed_size, "bytes ({:.1f}x).".format(original_size / compressed_size))
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser("Compress: chunked compression of data files for your convenience.")
+    parser.add_argument("--chunk-size", type=int, default=1024, help="Number of rows per chunk (default: 1024).")
+    parser.add_argument("--codec", type=str, default="zlib", choices=sorted(codecs.keys()), help="Compression codec (default: zlib).")
+    parser.add_argument("--in-file", type=str, default=None, help="Path to the numpy file to compress (default: none).")
+    parser.add_argument("--level", type=int, default=None, help="Compression level of the codec (default: codec default).")
+    parser.add_argument("--out-file", type=str, default=None, help="Path of the compressed file, typically with the '.npc' extension (default: none).")
+    parser.add_argument("--storage-dtype", type=str, default=None, help="Data type in which the data is stored, e.g., uint8 or float16 (default: data type of the input file).")
+    arguments, _ = parser.parse_known_args()
+    # Check if an input file has been specified.
+    if arguments.in_file is None:
+        raise ValueError("No input file has been specified.")
+    # Check if an output file has been specified.
+    if arguments.out_file is None:
+        raise ValueError("No output file has been specified.")
+
+    return arguments
+
+
+if __name__ == "__main__":
+    arguments = parse_arguments()
+    main(arguments)
@@ -22,9 +22,9 @@ def procedure_numpy(arguments):
     files = fetch_input_files(arguments)
     numpy_merge(input_files=files,
         output_file=arguments.out,
-        tempfile=arguments.tempfile,
         in_memory=arguments.in_memory,
-        axis=arguments.dimension)
+        axis=arguments.dimension,
+        workers=arguments.workers)
 
 
 def procedure_torch(arguments):
@@ -58,7 +58,7 @@ def select_extension_procedure(arguments):
     if extension in mappings.keys():
         procedure = mappings[extension]
     else:
-        procecure = None
+        procedure = None
 
     return procedure
 
@@ -71,7 +71,7 @@ def parse_arguments():
     parser.add_argument("--in-memory", action="store_true", help="Processes all chunks in memory (default: false).")
     parser.add_argument("--out", type=str, default=None, help="Output path to store the result (default: none).")
     parser.add_argument("--sort", action="store_true", help="Sort the input files before processing (default: false).")
-    parser.add_argument("--tempfile", type=str, default=None, help="Path of the temporary file to store the intermediate results, only accessible to non in-memory operations. (default: none).")
+    parser.add_argument("--workers", type=int, default=1, help="Number of concurrent copies of disjoint ranges (default: 1).")
     arguments, _ = parser.parse_known_args()
     # Check if a proper extension has been specified.
     if select_extension_procedure(arguments) is None:
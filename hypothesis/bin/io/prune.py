@@ -8,22 +8,33 @@ import os
 import shutil
 import torch
 
+from hypothesis.util.data.numpy.util import finite_rows
+from hypothesis.util.data.numpy.util import prune
+
 
 
 def main(arguments):
-    # Check if the file needs to be processed in memory.
-    if arguments.in_memory:
-        mmap_mode = 'r'
-    else:
-        mmap_mode = None
-    data = np.load(arguments.in_file, mmap_mode=mmap_mode)
-    data = np.delete(data, arguments.indices, arguments.dimension)
-    np.save(arguments.out_file, data)
+    prune(arguments.in_file, arguments.out_file,
+        indices=arguments.indices,
+        axis=arguments.dimension,
+        predicate=allocate_predicate(arguments),
+        chunk_size=arguments.chunk_size,
+        in_memory=arguments.in_memory)
+
+
+def allocate_predicate(arguments):
+    predicates = {
+        "finite": finite_rows,
+        "none": None}
+
+    return predicates[arguments.filter]
 
 
 def parse_arguments():
     parser = argparse.ArgumentParser("Prune: pruning data files for you convenience.")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="Number of rows to process at once (default: 10000).")
     parser.add_argument("--dimension", type=int, default=1, help="Data dimension to work in (default: 1).")
+    parser.add_argument("--filter", type=str, default="none", choices=["finite", "none"], help="Row filter, 'finite' removes the rows with NaN or infinite values (default: none).")
     parser.add_argument("--in-file", type=str, default=None, help="Path to the file to process (default: none).")
     parser.add_argument("--in-memory", action="store_true", help="Process the data in-memory (default: false).")
     parser.add_argument("--indices", type=str, default=None, help="A comma-seperated list of indices to remove (default: none).")
@@ -35,10 +46,11 @@ def parse_arguments():
     # Check if an output file has been specified.
     if arguments.out_file is None:
         raise ValueError("No output file has been specified.")
-    # Check if indices have been specified.
-    if arguments.indices is None:
-        raise ValueError("No indices have been specified.")
-    arguments.indices = [int(index) for index in arguments.indices.split(',')]
+    # Check if indices or a row filter have been specified.
+    if arguments.indices is None and arguments.filter == "none":
+        raise ValueError("No indices or row filter have been specified.")
+    if arguments.indices is not None:
+        arguments.indices = [int(index) for index in arguments.indices.split(',')]
 
     return arguments
 
@@ -0,0 +1,73 @@
+r"""Exports a trained ratio estimator for inference.
+
+The estimator is traced into a positional-argument module, frozen, and
+stored as a single TorchScript artifact. Optionally, the latency and
+throughput of the artifact (and of ``torch.compile``) are benchmarked
+against eager mode.
+"""
+
+import argparse
+import hypothesis
+import json
+import torch
+
+from hypothesis.nn.amortized_ratio_estimation.export import PositionalRatioEstimator
+from hypothesis.nn.amortized_ratio_estimation.export import benchmark
+from hypothesis.nn.amortized_ratio_estimation.export import compile_estimator
+from hypothesis.nn.amortized_ratio_estimation.export import export
+from hypothesis.nn.amortized_ratio_estimation.export import save
+from hypothesis.util.general import load_class
+
+
+
+def main(arguments):
+    estimator = load_class(arguments.estimator)()
+    if arguments.weights is not None:
+        estimator.load_state_dict(torch.load(arguments.weights, map_location="cpu"))
+    estimator = estimator.to(hypothesis.accelerator).eval()
+    example = {k: torch.randn((2,) + tuple(shape), device=hypothesis.accelerator) for k, shape in arguments.shapes.items()}
+    module = export(estimator, example)
+    if arguments.out is not None:
+        save(module, arguments.out)
+    # Check if the exported module has to be benchmarked.
+    if arguments.benchmark:
+        modules = {
+            "eager": PositionalRatioEstimator(estimator, module.variables),
+            "torchscript": module}
+        if arguments.compile:
+            modules["compile"] = compile_estimator(estimator, module.variables)
+        batch_sizes = [int(batch_size) for batch_size in arguments.batch_sizes.split(',')]
+        results = benchmark(modules, arguments.shapes, batch_sizes=batch_sizes, device=hypothesis.accelerator)
+        print("{:>12} {:>8} {:>14} {:>18}".format("mode", "batch", "latency (ms)", "samples / second"))
+        for name, measurements in results.items():
+            for batch_size, latency, throughput in measurements:
+                print("{:>12} {:>8} {:>14.3f} {:>18.1f}".format(name, batch_size, latency * 1000, throughput))
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser("Export: exporting ratio estimators for inference.")
+    parser.add_argument("--batch-sizes", type=str, default="1,16,256,4096,65536", help="Comma-separated batch sizes of the benchmark (default: 1,16,256,4096,65536).")
+    parser.add_argument("--benchmark", action="store_true", help="Benchmark the exported estimator against eager mode (default: false).")
+    parser.add_argument("--compile", action="store_true", help="Include torch.compile in the benchmark (default: false).")
+    parser.add_argument("--disable-gpu", action="store_true", help="Disable the usage of the GPU (default: false).")
+    parser.add_argument("--estimator", type=str, default=None, help="Full classname of the ratio estimator (default: none).")
+    parser.add_argument("--out", type=str, default=None, help="Path of the exported artifact (default: none).")
+    parser.add_argument("--shapes", type=str, default=None, help="JSON dictionary with the shape of a sample of every random variable, e.g., '{\"inputs\": [3], \"outputs\": [5]}' (default: none).")
+    parser.add_argument("--weights", type=str, default=None, help="Path of the weights of the estimator (default: none).")
+    arguments, _ = parser.parse_known_args()
+    if arguments.disable_gpu:
+        hypothesis.disable_gpu()
+    # Check if an estimator has been specified.
+    if arguments.estimator is None:
+        raise ValueError("No estimator has been specified.")
+    # Check if the shapes of the random variables have been specified.
+    if arguments.shapes is None:
+        raise ValueError("No shapes of the random variables have been specified.")
+    arguments.shapes = json.loads(arguments.shapes)
+
+    return arguments
+
+
+if __name__ == "__main__":
+    arguments = parse_arguments()
+    main(arguments)
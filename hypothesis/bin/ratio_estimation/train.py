@@ -1,4 +1,9 @@
-"""General training script fo Amortised Approximate Ratio Estimation (AARE)."""
+"""General training script fo Amortised Approximate Ratio Estimation (AARE).
+
+Distributed training is launched with ``torchrun``, e.g.,
+
+    torchrun --nproc_per_node=4 -m hypothesis.bin.ratio_estimation.train --distributed ...
+"""
 
 import argparse
 import hypothesis
@@ -12,6 +17,7 @@ from hypothesis.auto.training import create_trainer
 from hypothesis.nn.amortized_ratio_estimation import BaseConservativeCriterion
 from hypothesis.nn.amortized_ratio_estimation import BaseCriterion
 from hypothesis.nn.amortized_ratio_estimation import BaseExperimentalCriterion
+from hypothesis.util.general import load_class
 from torch.optim.lr_scheduler import ReduceLROnPlateau
 from torch.optim.lr_scheduler import StepLR
 from torch.utils.data import TensorDataset
@@ -20,6 +26,8 @@ from tqdm import tqdm
 
 
 def main(arguments):
+    # Initialize the process group, if requested.
+    rank = initialize_distributed(arguments)
     # Allocate the datasets
     dataset_test = allocate_dataset_test(arguments)
     dataset_train = allocate_dataset_train(arguments)
@@ -68,7 +76,13 @@ def main(arguments):
     Trainer = create_trainer(criterion, arguments.denominator)
     trainer = Trainer(
         accelerator=hypothesis.accelerator,
+        amp=arguments.amp,
+        amp_dtype=allocate_amp_dtype(arguments),
         batch_size=arguments.batch_size,
+        best_model_on_device=arguments.best_model_on_device,
+        channels_last=arguments.channels_last,
+        checkpoint=arguments.checkpoint,
+        checkpoint_every=arguments.checkpoint_every,
         criterion=criterion,
         dataset_test=dataset_test,
         dataset_train=dataset_train,
@@ -79,6 +93,7 @@ def main(arguments):
         optimizer=optimizer,
         workers=arguments.workers)
     # Register the callbacks
+    arguments.show = arguments.show and rank == 0
     if arguments.show:
         # Callbacks
         progress_bar = tqdm(total=arguments.epochs)
@@ -95,8 +110,10 @@ def main(arguments):
         # Cleanup the progress bar
         progress_bar.close()
         print(summary)
-    if arguments.out is None:
-        return # No output directory has been specified, exit.
+    if arguments.distributed:
+        torch.distributed.destroy_process_group()
+    if arguments.out is None or rank != 0:
+        return # No output directory has been specified, or not the first rank, exit.
     # Create the directory if it does not exist.
     if not os.path.exists(arguments.out):
         os.mkdir(arguments.out)
@@ -112,6 +129,22 @@ def main(arguments):
     summary.save(arguments.out + "/result.summary")
 
 
+def initialize_distributed(arguments):
+    r"""Initializes the process group from the environment variables set by
+    ``torchrun``, and returns the rank of the process."""
+    if not arguments.distributed:
+        return 0
+    torch.distributed.init_process_group(backend=arguments.backend, init_method="env://")
+    # Check if every process has to be assigned its own GPU.
+    if torch.cuda.is_available():
+        local_rank = int(os.environ.get("LOCAL_RANK", 0))
+        torch.cuda.set_device(local_rank)
+        hypothesis.accelerator = torch.device("cuda", local_rank)
+        hypothesis.a = hypothesis.accelerator
+
+    return torch.distributed.get_rank()
+
+
 @torch.no_grad()
 def allocate_dataset_train(arguments):
     return load_class(arguments.data_train)()
@@ -131,26 +164,35 @@ def allocate_dataset_test(arguments):
 def allocate_estimator(arguments):
     estimator = load_class(arguments.estimator)()
     # Check if we are able to allocate a data parallel model.
-    if torch.cuda.device_count() > 1 and arguments.data_parallel:
+    if torch.cuda.device_count() > 1 and arguments.data_parallel and not arguments.distributed:
         estimator = torch.nn.DataParallel(estimator)
     estimator = estimator.to(hypothesis.accelerator)
 
     return estimator
 
 
-def load_class(full_classname):
-    if full_classname is None:
-        raise ValueError("The specified classname cannot be `None`.")
-    module_name, class_name = full_classname.rsplit('.', 1)
-    module = __import__(module_name, fromlist=[class_name])
+def allocate_amp_dtype(arguments):
+    if arguments.amp_dtype is None:
+        return None # Derived from the accelerator by the trainer.
+    dtypes = {
+        "bfloat16": torch.bfloat16,
+        "float16": torch.float16}
 
-    return getattr(module, class_name)
+    return dtypes[arguments.amp_dtype]
 
 
 def parse_arguments():
     parser = argparse.ArgumentParser("Amortised Approximate Ratio Estimator training")
     # General settings
+    parser.add_argument("--amp", action="store_true", help="Enable automatic mixed precision training (default: false).")
+    parser.add_argument("--amp-dtype", type=str, default=None, choices=["bfloat16", "float16"], help="Reduced precision type of mixed precision training (default: float16 on GPU, bfloat16 on CPU).")
+    parser.add_argument("--backend", type=str, default="gloo", choices=["gloo", "nccl"], help="Backend of distributed training (default: gloo).")
+    parser.add_argument("--best-model-on-device", action="store_true", help="Keep the copy of the best model on the accelerator instead of in host memory (default: false).")
+    parser.add_argument("--channels-last", action="store_true", help="Store the 2-D and 3-D convolutional kernels in a channels-last memory format (default: false).")
+    parser.add_argument("--checkpoint", type=str, default=None, help="Path of the checkpoint, training resumes from it if it exists (default: none).")
+    parser.add_argument("--checkpoint-every", type=int, default=None, help="Additionally checkpoint every n batches (default: none, only at the end of an epoch).")
     parser.add_argument("--data-parallel", action="store_true", help="Enable data-parallel training if multiple GPU's are available (default: false).")
+    parser.add_argument("--distributed", action="store_true", help="Enable distributed data-parallel training, launched by torchrun (default: false).")
     parser.add_argument("--disable-gpu", action="store_true", help="Disable the usage of the GPU, not recommended. (default: false).")
     parser.add_argument("--out", type=str, default=None, help="Output directory (default: none).")
     parser.add_argument("--show", action="store_true", help="Show the progress and the final result (default: false).")
@@ -0,0 +1,184 @@
+r"""A utility program to simulate datasets.
+
+Draws inputs from a prior, simulates the corresponding outputs and stores
+them as shards ``inputs-XXXXX.npy`` and ``outputs-XXXXX.npy``, which can
+be loaded directly with::
+
+    Dataset("out/inputs-*.npy", "out/outputs-*.npy")
+
+Shards are written atomically and recorded, together with their seeds, in
+a manifest. A killed job therefore resumes where it stopped when it is
+started again with the same arguments, the files of shards which are not
+recorded in the manifest are removed before they are simulated again.
+"""
+
+import argparse
+import json
+import numpy as np
+import os
+import random
+import time
+import torch
+
+from hypothesis.simulation.util import sample_joint
+from hypothesis.util.general import load_class
+from multiprocessing import Pool
+
+
+manifest_name = "manifest.json"
+
+_models = {} # Simulator and prior of the worker processes.
+
+
+
+def main(arguments):
+    os.makedirs(arguments.out, exist_ok=True)
+    manifest = load_manifest(arguments)
+    shards = allocate_shards(arguments)
+    pending = [shard for shard in shards if str(shard[0]) not in manifest["shards"].keys()]
+    remove_shards(pending)
+    print("Simulating", len(pending), "of", len(shards), "shards.")
+    start = time.time()
+    simulations = 0
+    if arguments.workers > 1:
+        pool = Pool(processes=arguments.workers)
+        results = pool.imap_unordered(simulate_shard, pending)
+    else:
+        pool = None
+        results = map(simulate_shard, pending)
+    for index, seed, rows, duration in results:
+        manifest["shards"][str(index)] = {"rows": rows, "seed": seed}
+        store_manifest(arguments.out, manifest)
+        simulations += rows
+        throughput = simulations / (time.time() - start)
+        print("Shard", index, "completed ({:.1f} simulations / second).".format(throughput))
+    if pool is not None:
+        pool.close()
+        pool.join()
+    duration = time.time() - start
+    if duration > 0:
+        print("Simulated", simulations, "samples in {:.1f} seconds ({:.1f} simulations / second).".format(duration, simulations / duration))
+
+
+def allocate_shards(arguments):
+    num_shards = (arguments.n + arguments.shard_size - 1) // arguments.shard_size
+    width = max(5, len(str(num_shards - 1)))
+    # Derive independent seeds for every shard from the global seed.
+    sequences = np.random.SeedSequence(arguments.seed).spawn(num_shards)
+    shards = []
+    for index in range(num_shards):
+        rows = min(arguments.shard_size, arguments.n - index * arguments.shard_size)
+        seed = int(sequences[index].generate_state(1, dtype=np.uint32)[0])
+        name = "{:0{}d}.npy".format(index, width)
+        shards.append((index, seed, rows, arguments.out, name, arguments.simulator, arguments.prior))
+
+    return shards
+
+
+def simulate_shard(shard):
+    index, seed, rows, out, name, simulator_classname, prior_classname = shard
+    start = time.time()
+    simulator, prior = allocate_models(simulator_classname, prior_classname)
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+    with torch.no_grad():
+        inputs, outputs = sample_joint(simulator, prior, n=rows)
+    # Write both files before moving them into place.
+    paths = []
+    for prefix, data in (("inputs-", inputs), ("outputs-", outputs)):
+        path = os.path.join(out, prefix + name)
+        with open(path + ".tmp", "wb") as fd:
+            np.save(fd, as_numpy(data))
+        paths.append(path)
+    for path in paths:
+        os.replace(path + ".tmp", path)
+
+    return index, seed, rows, time.time() - start
+
+
+def remove_shards(shards):
+    r"""Removes the (partially) written files of the specified shards.
+
+    A shard is only complete once it is recorded in the manifest. A job
+    killed in between moving the inputs and the outputs into place would
+    otherwise leave an ``inputs-*`` file without its ``outputs-*`` file.
+    """
+    for index, seed, rows, out, name, simulator_classname, prior_classname in shards:
+        for prefix in ("inputs-", "outputs-"):
+            path = os.path.join(out, prefix + name)
+            for p in (path, path + ".tmp"):
+                if os.path.exists(p):
+                    os.remove(p)
+
+
+def allocate_models(simulator_classname, prior_classname):
+    key = (simulator_classname, prior_classname)
+    if key not in _models.keys():
+        _models[key] = (load_class(simulator_classname)(), load_class(prior_classname)())
+
+    return _models[key]
+
+
+def as_numpy(data):
+    if isinstance(data, torch.Tensor):
+        data = data.cpu().numpy()
+
+    return np.asarray(data)
+
+
+def load_manifest(arguments):
+    path = os.path.join(arguments.out, manifest_name)
+    settings = {
+        "n": arguments.n,
+        "prior": arguments.prior,
+        "seed": arguments.seed,
+        "shard_size": arguments.shard_size,
+        "simulator": arguments.simulator}
+    # Check if a previous job has to be resumed.
+    if os.path.exists(path):
+        with open(path, "r") as fd:
+            manifest = json.load(fd)
+        for key, value in settings.items():
+            if manifest[key] != value:
+                raise ValueError("The manifest in", arguments.out, "was created with a different", key, "(", manifest[key], ").")
+    else:
+        manifest = dict(settings)
+        manifest["shards"] = {}
+
+    return manifest
+
+
+def store_manifest(out, manifest):
+    path = os.path.join(out, manifest_name)
+    with open(path + ".tmp", "w") as fd:
+        json.dump(manifest, fd, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser("Simulate: simulating datasets for your convenience.")
+    parser.add_argument("--n", type=int, default=None, help="Total number of simulations (default: none).")
+    parser.add_argument("--out", type=str, default=".", help="Output directory of the shards and the manifest (default: '.').")
+    parser.add_argument("--prior", type=str, default=None, help="Full classname of the prior, e.g., hypothesis.benchmark.normal.Prior (default: none).")
+    parser.add_argument("--seed", type=int, default=0, help="Seed from which the seeds of the shards are derived (default: 0).")
+    parser.add_argument("--shard-size", type=int, default=100000, help="Number of simulations per shard (default: 100000).")
+    parser.add_argument("--simulator", type=str, default=None, help="Full classname of the simulator, e.g., hypothesis.benchmark.normal.Simulator (default: none).")
+    parser.add_argument("--workers", type=int, default=1, help="Number of simulation processes (default: 1).")
+    arguments, _ = parser.parse_known_args()
+    # Check if a simulator has been specified.
+    if arguments.simulator is None:
+        raise ValueError("No simulator has been specified.")
+    # Check if a prior has been specified.
+    if arguments.prior is None:
+        raise ValueError("No prior has been specified.")
+    # Check if the number of simulations has been specified.
+    if arguments.n is None or arguments.n <= 0:
+        raise ValueError("The number of simulations should be positive.")
+
+    return arguments
+
+
+if __name__ == "__main__":
+    arguments = parse_arguments()
+    main(arguments)
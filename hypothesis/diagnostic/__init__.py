@@ -1,2 +1,3 @@
 from .base import BaseDiagnostic
 from .density import DensityDiagnostic
+from .ratio_estimator import CoverageDiagnostic
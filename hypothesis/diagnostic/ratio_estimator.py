@@ -1,6 +1,203 @@
+import copy
 import hypothesis
 import numpy as np
 import torch
 
+from hypothesis.diagnostic import BaseDiagnostic
 from hypothesis.metric import roc_auc_score
 from hypothesis.metric import roc_curve
+from hypothesis.simulation.util import sample_joint
+from multiprocessing import Pool
+from scipy.stats import beta
+
+
+
+class CoverageDiagnostic(BaseDiagnostic):
+    r"""Expected coverage of the highest posterior density regions of a
+    likelihood-to-evidence ratio estimator.
+
+    Nominal parameters and observations are drawn from the prior and the
+    simulator in chunks. The posteriors of a chunk are evaluated on the
+    specified grid in batched estimator calls, together with the density
+    of the nominal parameters. For every pair, the credibility level of
+    the nominal parameter is the posterior mass of the grid points with
+    a larger density, i.e., the nominal parameter is covered by every
+    highest density region with a larger credibility. Only these levels
+    are retained, such that memory is bounded by the chunk size. Chunks
+    are seeded independently and can be evaluated by several processes.
+    The chunks are evaluated with a copy of the estimator, and the random
+    state of the caller is left untouched.
+
+    Example usage::
+
+        diagnostic = CoverageDiagnostic(estimator, simulator, prior, grid)
+        report = diagnostic.test(n=10000)
+        print(report["levels"], report["coverage"], report["lower"], report["upper"])
+
+    :param estimator: The ratio estimator, evaluated with the keyword
+                      arguments ``inputs`` and ``outputs``.
+    :param grid: Tensor of parameters on which the posteriors are
+                 evaluated, of shape ``(grid points, dimensionality)``.
+    :param levels: Nominal credibility levels.
+    :param batch_size: Number of parameter-observation pairs per estimator
+                       call.
+    :param chunk_size: Number of simulations per chunk.
+    :param confidence: Confidence level of the (Clopper-Pearson) bands.
+    :param workers: Number of processes.
+    """
+
+    def __init__(self, estimator, simulator, prior, grid,
+        levels=(0.5, 0.68, 0.9, 0.95, 0.99),
+        batch_size=hypothesis.default.batch_size * 64,
+        chunk_size=256,
+        confidence=0.95,
+        workers=1,
+        seed=0,
+        accelerator=hypothesis.accelerator):
+        super(CoverageDiagnostic, self).__init__()
+        self.accelerator = accelerator
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.confidence = confidence
+        self.credibilities = []
+        self.estimator = estimator
+        self.grid = grid.view(len(grid), -1)
+        self.levels = np.array(levels)
+        self.prior = prior
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.simulator = simulator
+        self.workers = workers
+
+    def reset(self):
+        self.credibilities = []
+
+    def _tasks(self, n):
+        sizes = [min(self.chunk_size, n - start) for start in range(0, n, self.chunk_size)]
+        sequences = self.seed_sequence.spawn(len(sizes))
+        seeds = [int(s.generate_state(1, dtype=np.uint32)[0]) for s in sequences]
+
+        return list(zip(seeds, sizes))
+
+    def stream(self, n):
+        r"""Evaluates the credibility levels of ``n`` nominal parameters,
+        yielded per chunk as they become available."""
+        state = (copy.deepcopy(self.estimator), self.simulator, self.prior, self.grid, self.batch_size)
+        tasks = self._tasks(n)
+        # Check if the chunks have to be evaluated by several processes.
+        if self.workers > 1:
+            state = (state[0].cpu(),) + state[1:]
+            pool = Pool(processes=self.workers, initializer=_initialize_worker, initargs=(state,))
+            try:
+                for credibilities in pool.imap(_evaluate_worker_chunk, tasks):
+                    self.credibilities.append(credibilities)
+                    yield credibilities
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            state = _initialize(state, self.accelerator)
+            for task in tasks:
+                credibilities = _evaluate_chunk(state, task)
+                self.credibilities.append(credibilities)
+                yield credibilities
+
+    def coverage(self):
+        r"""Empirical coverage of the nominal levels, with Clopper-Pearson
+        confidence bands, of all credibility levels evaluated so far."""
+        credibilities = np.concatenate(self.credibilities)
+        n = len(credibilities)
+        covered = (credibilities[:, None] < self.levels[None, :]).sum(axis=0)
+        quantile = (1 - self.confidence) / 2
+        lower = np.nan_to_num(beta.ppf(quantile, covered, n - covered + 1), nan=0.0)
+        upper = np.nan_to_num(beta.ppf(1 - quantile, covered + 1, n - covered), nan=1.0)
+
+        return {
+            "coverage": covered / n,
+            "levels": self.levels,
+            "lower": lower,
+            "n": n,
+            "upper": upper}
+
+    def test(self, n=1000):
+        for _ in self.stream(n):
+            pass
+
+        return self.coverage()
+
+
+
+_state = None # State of the worker processes.
+
+
+def _initialize(state, accelerator):
+    estimator, simulator, prior, grid, batch_size = state
+    estimator = estimator.to(accelerator).eval()
+    grid = grid.to(accelerator)
+    log_prior = _log_prob(prior, grid.cpu()).to(accelerator)
+
+    return (estimator, simulator, prior, grid, log_prior, batch_size, accelerator)
+
+
+def _initialize_worker(state):
+    global _state
+    torch.set_num_threads(1) # Parallelism is provided by the processes.
+    _state = _initialize(state, "cpu")
+
+
+def _evaluate_worker_chunk(task):
+    return _evaluate_chunk(_state, task)
+
+
+def _log_prob(prior, inputs):
+    log_prob = prior.log_prob(inputs)
+    if log_prob.dim() > 1:
+        log_prob = log_prob.view(len(inputs), -1).sum(dim=1)
+
+    return log_prob
+
+
+def _sample_chunk(simulator, prior, seed, size):
+    # Seed the simulations without affecting the global random state.
+    numpy_state = np.random.get_state()
+    devices = list(range(torch.cuda.device_count())) if torch.cuda.is_available() else []
+    try:
+        with torch.random.fork_rng(devices=devices):
+            torch.manual_seed(seed)
+            np.random.seed(seed)
+            return sample_joint(simulator, prior, n=size)
+    finally:
+        np.random.set_state(numpy_state)
+
+
+@torch.no_grad()
+def _evaluate_chunk(state, task):
+    estimator, simulator, prior, grid, log_prior, batch_size, accelerator = state
+    seed, size = task
+    inputs, outputs = _sample_chunk(simulator, prior, seed, size)
+    log_prior_inputs = _log_prob(prior, inputs).to(accelerator)
+    inputs = inputs.to(accelerator)
+    outputs = outputs.to(accelerator)
+    # The posterior of every observation is evaluated on the grid, and at
+    # the nominal parameter, in the same estimator call.
+    points = len(grid) + 1
+    posteriors = max(1, batch_size // points)
+    credibilities = []
+    for start in range(0, size, posteriors):
+        end = min(start + posteriors, size)
+        b = end - start
+        batch_inputs = torch.cat([
+            grid.unsqueeze(0).expand(b, -1, -1),
+            inputs[start:end].unsqueeze(1)], dim=1).reshape(b * points, -1)
+        batch_outputs = outputs[start:end].unsqueeze(1).expand((b, points) + tuple(outputs.shape[1:]))
+        batch_outputs = batch_outputs.reshape((b * points,) + tuple(outputs.shape[1:]))
+        log_ratios = estimator.log_ratio(inputs=batch_inputs, outputs=batch_outputs).view(b, points)
+        log_posterior = log_ratios + torch.cat([
+            log_prior.unsqueeze(0).expand(b, -1),
+            log_prior_inputs[start:end].unsqueeze(1)], dim=1)
+        log_posterior_grid = log_posterior[:, :-1]
+        log_posterior_inputs = log_posterior[:, -1:]
+        pdf = (log_posterior_grid - log_posterior_grid.max(dim=1, keepdim=True).values).exp()
+        mass = (pdf * (log_posterior_grid > log_posterior_inputs)).sum(dim=1)
+        credibilities.append((mass / pdf.sum(dim=1)).cpu())
+
+    return torch.cat(credibilities).numpy()
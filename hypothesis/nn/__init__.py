@@ -7,6 +7,7 @@ from .neuromodulation import NeuromodulatedReLU
 from .neuromodulation import NeuromodulatedSELU
 from .neuromodulation import NeuromodulatedTanh
 from .neuromodulation import allocate_default_neuromodulation_controller
+from .neuromodulation import allocate_shared_neuromodulation_controller
 from .neuromodulation import list_neuromodulated_modules
 # DenseNet
 from .densenet import DenseNetHead
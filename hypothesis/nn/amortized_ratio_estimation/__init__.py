@@ -17,4 +17,7 @@ from .multi_layered_perceptron import MutualInformationRatioEstimatorNeuromodula
 from .densenet import LikelihoodToEvidenceRatioEstimatorDenseNet
 # ResNet
 from .resnet import LikelihoodToEvidenceRatioEstimatorResNet
+# Distillation
+from .distillation import DistillationCriterion
+from .distillation import DistilledRatioEstimator
 from .util import build_ratio_estimator
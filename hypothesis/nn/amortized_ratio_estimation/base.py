@@ -20,22 +20,84 @@ class BaseRatioEstimator(torch.nn.Module):
 
 
 class RatioEstimatorEnsemble(BaseRatioEstimator):
+    r"""Ensemble of ratio estimators.
+
+    The members are registered as submodules. Whenever all members share
+    the same architecture, they are evaluated in a single batched forward
+    pass over their stacked parameters (``torch.func.vmap``), such that
+    the cost of the ensemble is close to the cost of a single member.
+    The parameters are stacked differentiably, which allows all members to
+    be trained concurrently. In that case, the reduction should be
+    disabled (``reduce=None``), such that the loss is the average of the
+    losses of the members. Outside of autograd (e.g., within MCMC), the
+    stacked parameters are cached until the members are modified.
+
+    :param estimators: The members of the ensemble.
+    :param reduce: Reduction of the log ratios of the members, ``"mean"``,
+                   ``"median"``, a callable or ``None``.
+    :param vectorize: Evaluates the members in a single batched pass.
+    """
 
     KEYWORD_REDUCE = "reduce"
 
-    def __init__(self, estimators, reduce="mean"):
+    def __init__(self, estimators, reduce="mean", vectorize=True):
         super(RatioEstimatorEnsemble, self).__init__()
-        self.estimators = estimators
+        self.estimators = torch.nn.ModuleList(estimators)
         self.reduce = self._allocate_reduce(reduce)
+        self.stacked = None
+        self.stacked_key = None
+        self.vectorize = vectorize and self._homogeneous()
+
+    def _homogeneous(self):
+        def signature(estimator):
+            return [(k, type(v), v.shape) for k, v in estimator.state_dict().items()]
+        reference = signature(self.estimators[0])
+
+        return all(type(e) == type(self.estimators[0]) and signature(e) == reference for e in self.estimators)
+
+    def _stack(self):
+        # Check if the cached parameters are still valid.
+        if not torch.is_grad_enabled():
+            tensors = list(self.estimators.parameters()) + list(self.estimators.buffers())
+            key = tuple((t.data_ptr(), t._version) for t in tensors)
+            if key == self.stacked_key:
+                return self.stacked
+        parameters = [dict(e.named_parameters()) for e in self.estimators]
+        buffers = [dict(e.named_buffers()) for e in self.estimators]
+        stacked = (
+            {k: torch.stack([p[k] for p in parameters]) for k in parameters[0].keys()},
+            {k: torch.stack([b[k] for b in buffers]) for k in buffers[0].keys()})
+        # The cache cannot hold autograd graphs, which are freed by backward.
+        if torch.is_grad_enabled():
+            self.stacked = None
+            self.stacked_key = None
+        else:
+            self.stacked = stacked
+            self.stacked_key = key
 
-    def reduce_as(self, reduce):
-        self.reduce = self._allocate_reduce(reduce)
+        return stacked
 
-    def to(self, device):
-        for index in range(len(self.estimators)):
-            self.estimators[index] = self.estimators[index].to(device)
+    def _log_ratios_vectorized(self, **kwargs):
+        parameters, buffers = self._stack()
+        template = self.estimators[0]
 
-        return self
+        def evaluate(parameters, buffers, kwargs):
+            _, log_ratios = torch.func.functional_call(template, (parameters, buffers), args=(), kwargs=kwargs)
+            return log_ratios
+
+        log_ratios = torch.func.vmap(evaluate, in_dims=(0, 0, None), randomness="different")(parameters, buffers, kwargs)
+
+        return log_ratios.view(len(self.estimators), -1).t() # Members along the second dimension.
+
+    def _log_ratios_sequential(self, **kwargs):
+        log_ratios = []
+        for estimator in self.estimators:
+            log_ratios.append(estimator.log_ratio(**kwargs))
+
+        return torch.cat(log_ratios, dim=1)
+
+    def reduce_as(self, reduce):
+        self.reduce = self._allocate_reduce(reduce)
 
     def log_ratio(self, **kwargs):
         # Check if the 'reduce' keyword is an argument.
@@ -44,12 +106,14 @@ class RatioEstimatorEnsemble(BaseRatioEstimator):
             del kwargs[RatioEstimatorEnsemble.KEYWORD_REDUCE]
         else:
             reduce = True # Default value
-        # Estimate the log ratios
-        log_ratios = []
-        for estimator in self.estimators:
-            log_ratios.append(estimator.log_ratio(**kwargs))
-        log_ratios = torch.cat(log_ratios, dim=1)
-        if reduce:
+        # Estimate the log ratios. Updates of buffers (e.g., batch
+        # normalization statistics) require the sequential evaluation.
+        has_buffers = any(True for _ in self.estimators.buffers())
+        if self.vectorize and not (self.training and has_buffers):
+            log_ratios = self._log_ratios_vectorized(**kwargs)
+        else:
+            log_ratios = self._log_ratios_sequential(**kwargs)
+        if reduce and self.reduce is not None:
             log_ratios = self.reduce(log_ratios).view(-1, 1)
 
         return log_ratios
@@ -59,8 +123,7 @@ class RatioEstimatorEnsemble(BaseRatioEstimator):
         reductions = {
             "mean": RatioEstimatorEnsemble._reduce_mean,
             "median": RatioEstimatorEnsemble._reduce_median}
-        reduce = None
-        if hasattr(f, "__call__"):
+        if f is None or hasattr(f, "__call__"):
             return f
         else:
             return reductions[f]
@@ -111,6 +174,15 @@ class BaseCriterion(torch.nn.Module):
 
         return groups
 
+    def _loss(self, y, target):
+        # The loss is always evaluated in full precision, also under autocast.
+        # Targets are broadcasted over estimators with several outputs per
+        # sample, e.g., unreduced ensembles.
+        with torch.autocast(device_type=y.device.type, enabled=False):
+            loss = self.criterion(y.float(), target.expand_as(y))
+
+        return loss
+
     def _forward_without_logits(self, **kwargs):
         y_dependent, _ = self.estimator(**kwargs)
         for group in self.independent_random_variables:
@@ -118,7 +190,7 @@ class BaseCriterion(torch.nn.Module):
             for variable in group:
                 kwargs[variable] = kwargs[variable][random_indices] # Make variable independent.
         y_independent, _ = self.estimator(**kwargs)
-        loss = self.criterion(y_dependent, self.ones) + self.criterion(y_independent, self.zeros)
+        loss = self._loss(y_dependent, self.ones) + self._loss(y_independent, self.zeros)
 
         return loss
 
@@ -129,7 +201,7 @@ class BaseCriterion(torch.nn.Module):
             for variable in group:
                 kwargs[variable] = kwargs[variable][random_indices] # Make variable independent.
         _, y_independent = self.estimator(**kwargs)
-        loss = self.criterion(y_dependent, self.ones) + self.criterion(y_independent, self.zeros)
+        loss = self._loss(y_dependent, self.ones) + self._loss(y_independent, self.zeros)
 
         return loss
 
@@ -174,7 +246,7 @@ class BaseConservativeCriterion(BaseCriterion):
             for variable in group:
                 kwargs[variable] = kwargs[variable][random_indices] # Make variable independent.
         y_independent, _ = self.estimator(**kwargs)
-        loss = ((1 - beta) * self.criterion(y_dependent, self.ones) + beta * self.criterion(y_independent, self.ones)) + self.criterion(y_independent, self.zeros)
+        loss = ((1 - beta) * self._loss(y_dependent, self.ones) + beta * self._loss(y_independent, self.ones)) + self._loss(y_independent, self.zeros)
 
         return loss
 
@@ -186,7 +258,7 @@ class BaseConservativeCriterion(BaseCriterion):
             for variable in group:
                 kwargs[variable] = kwargs[variable][random_indices] # Make variable independent.
         _, y_independent = self.estimator(**kwargs)
-        loss = ((1 - beta) * self.criterion(y_dependent, self.ones) + beta * self.criterion(y_independent, self.ones)) + self.criterion(y_independent, self.zeros)
+        loss = ((1 - beta) * self._loss(y_dependent, self.ones) + beta * self._loss(y_independent, self.ones)) + self._loss(y_independent, self.zeros)
 
 
         return loss
@@ -215,7 +287,7 @@ class BaseExperimentalCriterion(BaseCriterion):
             for variable in group:
                 kwargs[variable] = kwargs[variable][random_indices] # Make variable independent.
         y_independent, _ = self.estimator(**kwargs)
-        loss = self.criterion(y_dependent, self.ones) + self.criterion(y_independent, self.zeros)
+        loss = self._loss(y_dependent, self.ones) + self._loss(y_independent, self.zeros)
         loss = loss + self.beta * ((self.base - loss.detach()).abs() / 2 - log_ratios.mean()) ** 2
 
         return loss
@@ -227,7 +299,7 @@ class BaseExperimentalCriterion(BaseCriterion):
             for variable in group:
                 kwargs[variable] = kwargs[variable][random_indices] # Make variable independent.
         _, y_independent = self.estimator(**kwargs)
-        loss = self.criterion(y_dependent, self.ones) + self.criterion(y_independent, self.zeros)
+        loss = self._loss(y_dependent, self.ones) + self._loss(y_independent, self.zeros)
         loss = loss + self.beta * ((self.base - loss.detach()).abs() / 2 - log_ratios.mean()) ** 2
 
         return loss
@@ -21,6 +21,7 @@ class LikelihoodToEvidenceRatioEstimatorDenseNet(BaseLikelihoodToEvidenceRatioEs
         convolution_bias=hypothesis.nn.densenet.default.convolution_bias,
         depth=hypothesis.nn.densenet.default.depth,
         dropout=hypothesis.default.dropout,
+        memory_efficient=hypothesis.nn.densenet.default.memory_efficient,
         trunk_activation=None,
         trunk_dropout=None,
         trunk_layers=hypothesis.default.trunk):
@@ -34,6 +35,7 @@ class LikelihoodToEvidenceRatioEstimatorDenseNet(BaseLikelihoodToEvidenceRatioEs
             convolution_bias=convolution_bias,
             depth=depth,
             dropout=dropout,
+            memory_efficient=memory_efficient,
             shape_xs=shape_outputs)
         # Compute the embedding dimensionality of the head.
         embedding_dim = self.head.embedding_dimensionality()
@@ -0,0 +1,200 @@
+r"""Distillation of ratio estimators into small and fast students.
+
+A ``MultiLayeredPerceptron`` student is trained to regress the log ratios
+of a (large) teacher, evaluated on samples of the prior and the posterior.
+For convolutional teachers, the student operates on the embeddings of the
+head of the teacher. These are computed once per observation and cached,
+such that repeated evaluations for the same observation (e.g., MCMC) only
+evaluate the student::
+
+    dataset = distillation_dataset(teacher, inputs, outputs, head=teacher.head)
+    student = DistilledRatioEstimator(
+        shape_inputs=(2,),
+        shape_features=(teacher.head.embedding_dimensionality(),),
+        head=teacher.head)
+    trainer = DistillationTrainer(
+        estimator=student,
+        optimizer=torch.optim.Adam(student.parameters()),
+        dataset_train=dataset)
+    trainer.fit()
+    print(evaluate(teacher, student, inputs, observation))
+"""
+
+import copy
+import hypothesis
+import time
+import torch
+
+from hypothesis.nn import MultiLayeredPerceptron
+from hypothesis.nn.util import compute_dimensionality
+from hypothesis.nn.util import evaluation_mode
+from torch.utils.data import TensorDataset
+
+from .likelihood_to_evidence import BaseLikelihoodToEvidenceRatioEstimator
+
+
+
+class DistilledRatioEstimator(BaseLikelihoodToEvidenceRatioEstimator):
+    r"""Student estimator, an MLP mapping the inputs and the features of
+    the outputs to the log ratio.
+
+    :param shape_inputs: Shape of the inputs.
+    :param shape_features: Shape of the features, i.e., the outputs or
+                           their embedding if a head is specified.
+    :param head: Optional (convolutional) head of the teacher, a frozen
+                 copy is used to embed the outputs.
+    """
+
+    def __init__(self,
+        shape_inputs,
+        shape_features,
+        head=None,
+        activation=hypothesis.default.activation,
+        dropout=hypothesis.default.dropout,
+        layers=(128, 128)):
+        super(DistilledRatioEstimator, self).__init__()
+        self.features_dimensionality = compute_dimensionality(shape_features)
+        self.inputs_dimensionality = compute_dimensionality(shape_inputs)
+        # Check if the outputs have to be embedded by a head.
+        if head is not None:
+            head = copy.deepcopy(head).eval().requires_grad_(False)
+        self.head = head
+        self.embedded_outputs = None
+        self.embedded_version = None
+        self.embedding = None
+        self.mlp = MultiLayeredPerceptron(
+            shape_xs=(self.inputs_dimensionality + self.features_dimensionality,),
+            shape_ys=(1,),
+            activation=activation,
+            dropout=dropout,
+            layers=layers,
+            transform_output=None)
+
+    def train(self, mode=True):
+        super(DistilledRatioEstimator, self).train(mode)
+        # The head is frozen, its statistics are never updated.
+        if self.head is not None:
+            self.head.eval()
+
+        return self
+
+    @torch.no_grad()
+    def embed(self, outputs):
+        r"""Features of the outputs. The embedding of the most recent
+        outputs is cached until they are modified."""
+        if self.head is None:
+            return outputs.view(-1, self.features_dimensionality)
+        # Check if the embedding of these outputs is cached.
+        if outputs is not self.embedded_outputs or outputs._version != self.embedded_version:
+            self.embedding = self.head(outputs).view(-1, self.features_dimensionality)
+            self.embedded_outputs = outputs
+            self.embedded_version = outputs._version
+
+        return self.embedding
+
+    def log_ratio_features(self, inputs, features):
+        inputs = inputs.view(-1, self.inputs_dimensionality)
+        features = features.view(-1, self.features_dimensionality)
+        # A single observation is shared by all inputs.
+        if features.shape[0] == 1:
+            features = features.expand(inputs.shape[0], -1)
+
+        return self.mlp(torch.cat([inputs, features], dim=1))
+
+    def log_ratio(self, inputs, outputs):
+        return self.log_ratio_features(inputs, self.embed(outputs))
+
+
+
+class DistillationCriterion(torch.nn.Module):
+    r"""Mean squared error between the log ratios of the student and the
+    log ratios of the teacher."""
+
+    def __init__(self, estimator):
+        super(DistillationCriterion, self).__init__()
+        self.criterion = torch.nn.MSELoss()
+        self.estimator = estimator
+
+    def forward(self, inputs, features, log_ratios):
+        y = self.estimator.log_ratio_features(inputs, features)
+        # The loss is always evaluated in full precision, also under autocast.
+        with torch.autocast(device_type=y.device.type, enabled=False):
+            loss = self.criterion(y.float(), log_ratios.view_as(y).float())
+
+        return loss
+
+
+
+@torch.no_grad()
+def distillation_dataset(teacher, inputs, outputs, head=None, marginals=True, batch_size=1024, accelerator=hypothesis.accelerator):
+    r"""Evaluates the teacher on the specified pairs of inputs and outputs.
+
+    Samples of the joint (e.g., from the prior and the simulator) are
+    complemented by samples of the product of the marginals if
+    ``marginals`` is set. Samples of a posterior are included by passing
+    the posterior samples as inputs and the (repeated) observation as
+    outputs, with ``marginals`` disabled. Datasets can be combined with
+    ``torch.utils.data.ConcatDataset``. The modes and devices of the
+    teacher and the head are restored afterwards.
+
+    :param head: Head of the teacher, the outputs are then stored as their
+                 embeddings.
+    :return: ``TensorDataset`` of inputs, features and teacher log ratios.
+    """
+    models = [teacher] if head is None else [teacher, head]
+    if marginals:
+        inputs = torch.cat([inputs, inputs])
+        outputs = torch.cat([outputs, outputs[torch.randperm(len(outputs))]])
+    features = []
+    log_ratios = []
+    with evaluation_mode(*models, device=accelerator):
+        for start in range(0, len(inputs), batch_size):
+            batch_inputs = inputs[start:start + batch_size].to(accelerator)
+            batch_outputs = outputs[start:start + batch_size].to(accelerator)
+            log_ratios.append(teacher.log_ratio(inputs=batch_inputs, outputs=batch_outputs).view(-1, 1).cpu())
+            if head is not None:
+                batch_outputs = head(batch_outputs).view(len(batch_inputs), -1)
+            features.append(batch_outputs.cpu())
+
+    return TensorDataset(inputs.cpu(), torch.cat(features), torch.cat(log_ratios))
+
+
+@torch.no_grad()
+def evaluate(teacher, student, inputs, outputs, repeat=10):
+    r"""Compares the student against the teacher.
+
+    Both are evaluated on the specified inputs, for the specified outputs
+    (a batch, or a single observation shared by all inputs, as within
+    MCMC).
+
+    :return: Dictionary with the mean and maximum absolute deviation and
+             the correlation of the log ratios, and the speedup of the
+             student.
+    """
+    teacher_outputs = outputs
+    if outputs.shape[0] != inputs.shape[0]:
+        teacher_outputs = outputs.expand((inputs.shape[0],) + tuple(outputs.shape[1:]))
+    durations = {}
+    results = {}
+    with evaluation_mode(teacher, student):
+        for name, model, x in (("teacher", teacher, teacher_outputs), ("student", student, outputs)):
+            results[name] = model.log_ratio(inputs=inputs, outputs=x).view(-1) # Warmup
+            _synchronize(inputs.device)
+            start = time.perf_counter()
+            for _ in range(repeat):
+                model.log_ratio(inputs=inputs, outputs=x)
+            _synchronize(inputs.device)
+            durations[name] = (time.perf_counter() - start) / repeat
+    deviation = (results["student"] - results["teacher"]).abs()
+    correlation = torch.corrcoef(torch.stack([results["student"], results["teacher"]]))[0, 1]
+
+    return {
+        "log_ratio_correlation": correlation.item(),
+        "log_ratio_deviation_max": deviation.max().item(),
+        "log_ratio_deviation_mean": deviation.mean().item(),
+        "speedup": durations["teacher"] / durations["student"]}
+
+
+def _synchronize(device):
+    if torch.device(device).type == "cuda":
+        torch.cuda.synchronize(device)
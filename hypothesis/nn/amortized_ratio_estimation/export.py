@@ -0,0 +1,126 @@
+r"""Export of ratio estimators for inference.
+
+Ratio estimators take their random variables as keyword arguments, which
+are gathered, reshaped and concatenated in Python at every call. Exported
+estimators take the random variables positionally, are traced and frozen
+with TorchScript, and are stored as a single artifact which can be loaded
+without the code of the estimator::
+
+    module = export(estimator, {"inputs": inputs, "outputs": outputs})
+    save(module, "estimator.pt")
+    module, variables = load("estimator.pt")
+    log_ratios = module(inputs, outputs)
+"""
+
+import copy
+import json
+import time
+import torch
+
+
+
+class PositionalRatioEstimator(torch.nn.Module):
+    r"""Evaluates the log ratios of an estimator with the random variables
+    passed positionally, in the order of ``variables``."""
+
+    def __init__(self, estimator, variables):
+        super(PositionalRatioEstimator, self).__init__()
+        self.estimator = estimator
+        self.variables = list(variables)
+
+    def forward(self, *tensors):
+        return self.estimator.log_ratio(**dict(zip(self.variables, tensors)))
+
+
+
+@torch.no_grad()
+def export(estimator, example, freeze=True):
+    r"""Traces the estimator into a positional-argument inference module.
+
+    :param estimator: The ratio estimator.
+    :param example: Dictionary with an example batch of every random
+                    variable, its keys define the order of the arguments.
+    :param freeze: Folds the parameters into the module as constants.
+
+    The estimator is traced in evaluation mode, the modes of its modules
+    are restored afterwards.
+    """
+    variables = list(example.keys())
+    modes = [(m, m.training) for m in estimator.modules()]
+    tensors = tuple(example[k] for k in variables)
+    # Check the trace against another batch size, as the traced module
+    # should not depend on the batch size of the example.
+    check = tuple(torch.cat([t, t], dim=0) for t in tensors)
+    try:
+        module = PositionalRatioEstimator(estimator, variables).eval()
+        module = torch.jit.trace(module, tensors, check_inputs=[check])
+    finally:
+        for m, training in modes:
+            m.training = training
+    if freeze:
+        module = torch.jit.freeze(module)
+    module.variables = variables
+
+    return module
+
+
+def compile_estimator(estimator, variables, **kwargs):
+    r"""Compiles the positional-argument inference module of a copy of the
+    estimator, in evaluation mode, with ``torch.compile``. Compiled
+    modules cannot be stored, use ``export`` to obtain an artifact."""
+    module = PositionalRatioEstimator(copy.deepcopy(estimator), variables).eval()
+
+    return torch.compile(module, **kwargs)
+
+
+def save(module, path):
+    r"""Stores the exported module, together with the order of its
+    arguments, in a single file."""
+    extra_files = {"variables.json": json.dumps(module.variables)}
+    torch.jit.save(module, path, _extra_files=extra_files)
+
+
+def load(path, map_location=None):
+    r"""Loads an exported module. Returns the module and the names of its
+    positional arguments."""
+    extra_files = {"variables.json": ""}
+    module = torch.jit.load(path, map_location=map_location, _extra_files=extra_files)
+    variables = json.loads(extra_files["variables.json"])
+    module.variables = variables
+
+    return module, variables
+
+
+@torch.no_grad()
+def benchmark(modules, shapes, batch_sizes=(1, 16, 256, 4096, 65536), repeat=10, device="cpu"):
+    r"""Benchmarks the latency and throughput of the specified modules.
+
+    :param modules: Dictionary of callables with positional arguments,
+                    e.g., the eager estimator and its exported module.
+    :param shapes: Dictionary with the shape of a single sample of every
+                   random variable, in the order of the arguments.
+    :return: Dictionary mapping every module name to a list of
+             ``(batch_size, latency in seconds, samples per second)``.
+    """
+    results = {name: [] for name in modules.keys()}
+    for batch_size in batch_sizes:
+        tensors = tuple(torch.randn((batch_size,) + tuple(shape), device=device) for shape in shapes.values())
+        for name, module in modules.items():
+            # Warmup, includes the compilation and the profiling runs of
+            # the TorchScript executor.
+            for _ in range(3):
+                module(*tensors)
+            _synchronize(device)
+            start = time.perf_counter()
+            for _ in range(repeat):
+                module(*tensors)
+            _synchronize(device)
+            latency = (time.perf_counter() - start) / repeat
+            results[name].append((batch_size, latency, batch_size / latency))
+
+    return results
+
+
+def _synchronize(device):
+    if torch.device(device).type == "cuda":
+        torch.cuda.synchronize(device)
@@ -6,6 +6,7 @@ from hypothesis.nn.amortized_ratio_estimation import BaseMutualInformationRatioE
 from hypothesis.nn.neuromodulation import BaseNeuromodulatedModule
 from hypothesis.nn.neuromodulation import allocate_neuromodulated_activation
 from hypothesis.nn.neuromodulation import list_neuromodulated_modules
+from hypothesis.nn.neuromodulation import neuromodulated_forward
 from hypothesis.nn.util import compute_dimensionality
 
 
@@ -42,8 +43,17 @@ class MutualInformationRatioEstimatorNeuromodulatedMLP(BaseMutualInformationRati
         controller_allocator,
         activation=hypothesis.default.activation,
         dropout=hypothesis.default.dropout,
-        layers=hypothesis.default.trunk):
+        layers=hypothesis.default.trunk,
+        shared_controller=False):
         super(MutualInformationRatioEstimatorNeuromodulatedMLP, self).__init__()
+        # Check if a single controller modulates all activations, the
+        # controller allocator then receives the number of units of every
+        # neuromodulated activation.
+        if shared_controller:
+            self.controller = controller_allocator(features=layers)
+            controller_allocator = None
+        else:
+            self.controller = None
         # Allocate the neuromodulated activation.
         neuromodulated_activation = allocate_neuromodulated_activation(
             activation=activation,
@@ -60,7 +70,13 @@ class MutualInformationRatioEstimatorNeuromodulatedMLP(BaseMutualInformationRati
         self.neuromodulated_modules = list_neuromodulated_modules(self)
 
     def log_ratio(self, x, y):
-        for module in self.neuromodulated_modules:
-            module.update(context=y)
+        # Check if the modulations are computed by a shared controller.
+        if self.controller is not None:
+            modulations = self.controller(y)
+        else:
+            modulations = None
+        z = x.view(-1, self.mlp.xs_dimensionality)
 
-        return self.mlp(x)
+        return neuromodulated_forward(self.mlp.mapping, z,
+            context=y,
+            modulations=modulations)
@@ -0,0 +1,140 @@
+r"""Post-training quantization of ratio estimators for CPU inference.
+
+Linear layers (e.g., the MLP trunks) are quantized dynamically, their
+weights are stored in 8 bits and activations are quantized on the fly.
+Convolutional heads (``ResNetHead`` and ``DenseNetHead``) are quantized
+statically, the ranges of their activations are calibrated on a dataset.
+As quantization affects the estimated log ratios, ``evaluate`` reports the
+deviation of the quantized estimator, its ROC-AUC and its speedup with
+respect to the full-precision estimator::
+
+    quantized = quantize(estimator, calibration=Dataset("inputs.npy", "outputs.npy"))
+    print(evaluate(estimator, quantized, dataset))
+"""
+
+import copy
+import time
+import torch
+
+from hypothesis.metric.roc_auc import roc_auc_score
+from hypothesis.nn.densenet import DenseNetHead
+from hypothesis.nn.resnet import ResNetHead
+from torch.ao.quantization import get_default_qconfig_mapping
+from torch.ao.quantization import quantize_dynamic
+from torch.ao.quantization.quantize_fx import convert_fx
+from torch.ao.quantization.quantize_fx import prepare_fx
+from torch.utils.data import DataLoader
+
+
+convolutional_heads = (DenseNetHead, ResNetHead)
+
+
+
+def quantize(estimator, calibration=None, variables=("inputs", "outputs"), batch_size=256, batches=10, backend="x86"):
+    r"""Quantizes a copy of the specified estimator.
+
+    :param estimator: The full-precision ratio estimator.
+    :param calibration: Dataset on which the convolutional heads are
+                        calibrated, required if the estimator has any.
+    :param variables: Names of the random variables of the dataset items.
+    :param batches: Number of calibration batches.
+    :param backend: Quantized backend, ``"x86"``, ``"fbgemm"`` or
+                    ``"qnnpack"`` (ARM). The quantized engine is only
+                    set during quantization, inference with another
+                    backend than the default engine requires setting
+                    ``torch.backends.quantized.engine``.
+    """
+    engine = torch.backends.quantized.engine
+    torch.backends.quantized.engine = _engine(backend)
+    try:
+        estimator = copy.deepcopy(estimator).cpu().eval()
+        estimator = quantize_heads(estimator, calibration, variables, batch_size, batches, backend)
+        estimator = quantize_dynamic(estimator, {torch.nn.Linear}, dtype=torch.qint8)
+    finally:
+        torch.backends.quantized.engine = engine
+
+    return estimator
+
+
+@torch.no_grad()
+def quantize_heads(estimator, dataset, variables=("inputs", "outputs"), batch_size=256, batches=10, backend="x86"):
+    r"""Statically quantizes the convolutional heads of the estimator in
+    place, the heads are calibrated on the specified dataset."""
+    heads = [(name, module) for name, module in estimator.named_modules() if isinstance(module, convolutional_heads)]
+    if len(heads) == 0:
+        return estimator
+    # Check if a calibration dataset has been specified.
+    if dataset is None:
+        raise ValueError("Static quantization of convolutional heads requires a calibration dataset.")
+    qconfig_mapping = get_default_qconfig_mapping(backend)
+    for name, head in heads:
+        example = (torch.randn((1, head.channels) + tuple(head.shape_xs)),)
+        _set_submodule(estimator, name, prepare_fx(head, qconfig_mapping, example))
+    # Calibrate the activation ranges.
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=True)
+    for index, batch in enumerate(loader):
+        if index >= batches:
+            break
+        estimator.log_ratio(**dict(zip(variables, batch)))
+    for name, _ in heads:
+        _set_submodule(estimator, name, convert_fx(estimator.get_submodule(name)))
+
+    return estimator
+
+
+@torch.no_grad()
+def evaluate(reference, quantized, dataset, variables=("inputs", "outputs"), batch_size=1024, batches=10):
+    r"""Compares the quantized estimator against the full-precision one.
+
+    The log ratios are evaluated on samples of the joint (dataset items)
+    and of the product of the marginals (items with shuffled outputs).
+
+    :return: Dictionary with the mean and maximum absolute deviation of
+             the log ratios, the ROC-AUC of both estimators and the
+             speedup of the quantized estimator.
+    """
+    reference = reference.cpu().eval()
+    quantized = quantized.eval()
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=True, drop_last=True)
+    log_ratios_reference = []
+    log_ratios_quantized = []
+    targets = []
+    durations = {"quantized": 0.0, "reference": 0.0}
+    for index, batch in enumerate(loader):
+        if index >= batches:
+            break
+        joint = dict(zip(variables, batch))
+        marginals = dict(joint)
+        marginals[variables[-1]] = joint[variables[-1]][torch.randperm(batch_size)]
+        for kwargs, target in ((joint, 1.0), (marginals, 0.0)):
+            for name, model, results in (("reference", reference, log_ratios_reference), ("quantized", quantized, log_ratios_quantized)):
+                start = time.perf_counter()
+                results.append(model.log_ratio(**kwargs).view(-1))
+                durations[name] += time.perf_counter() - start
+            targets.append(torch.full((batch_size,), target))
+    log_ratios_reference = torch.cat(log_ratios_reference)
+    log_ratios_quantized = torch.cat(log_ratios_quantized)
+    targets = torch.cat(targets)
+    deviation = (log_ratios_quantized - log_ratios_reference).abs()
+
+    return {
+        "auc_quantized": roc_auc_score(log_ratios_quantized, targets),
+        "auc_reference": roc_auc_score(log_ratios_reference, targets),
+        "log_ratio_deviation_max": deviation.max().item(),
+        "log_ratio_deviation_mean": deviation.mean().item(),
+        "speedup": durations["reference"] / durations["quantized"]}
+
+
+def _engine(backend):
+    # The default qconfig of the x86 backend targets the x86 engine, which
+    # falls back on fbgemm in older releases.
+    if backend in torch.backends.quantized.supported_engines:
+        return backend
+    else:
+        return "fbgemm"
+
+
+def _set_submodule(module, name, submodule):
+    parent_name, _, attribute = name.rpartition('.')
+    parent = module.get_submodule(parent_name) if parent_name else module
+    setattr(parent, attribute, submodule)
@@ -7,6 +7,7 @@ from hypothesis.nn import ResNetHead
 from hypothesis.nn.amortized_ratio_estimation import BaseRatioEstimator
 from hypothesis.nn.resnet.default import batchnorm as default_batchnorm
 from hypothesis.nn.resnet.default import channels as default_channels
+from hypothesis.nn.resnet.default import checkpoint_segments as default_checkpoint_segments
 from hypothesis.nn.resnet.default import convolution_bias as default_convolution_bias
 from hypothesis.nn.resnet.default import depth as default_depth
 from hypothesis.nn.resnet.default import dilate as default_dilate
@@ -33,6 +34,7 @@ def build_ratio_estimator(random_variables, **kwargs):
             activation=hypothesis.default.activation,
             batchnorm=default_batchnorm,
             channels=default_channels,
+            checkpoint_segments=default_checkpoint_segments,
             convolution_bias=default_convolution_bias,
             depth=depth,
             dilate=default_dilate,
@@ -48,6 +50,7 @@ def build_ratio_estimator(random_variables, **kwargs):
                 activation=hypothesis.default.activation,
                 batchnorm=batchnorm,
                 channels=channels,
+                checkpoint_segments=checkpoint_segments,
                 convolution_bias=convolution_bias,
                 depth=depth,
                 dilate=dilate,
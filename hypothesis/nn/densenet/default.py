@@ -12,3 +12,7 @@ r"""Add biases in convolutions by default in Hypothesis."""
 
 channels = 3
 r"""Default number of data channels (e.g., channels in images)."""
+
+memory_efficient = False
+r"""Default usage of memory-efficient dense blocks (recomputation of the
+bottlenecks during training, shared feature storage during inference)."""
@@ -1,19 +1,24 @@
+import contextlib
 import hypothesis
 import hypothesis.nn
 import hypothesis.nn.densenet
 import torch
+import torch.utils.checkpoint
 
 from .default import batchnorm as default_batchnorm
 from .default import bottleneck_factor as default_bottleneck_factor
 from .default import channels as default_channels
 from .default import convolution_bias as default_convolution_bias
 from .default import depth as default_depth
+from .default import memory_efficient as default_memory_efficient
 from hypothesis.nn.densenet.util import load_configuration_121
 from hypothesis.nn.densenet.util import load_configuration_161
 from hypothesis.nn.densenet.util import load_configuration_169
 from hypothesis.nn.densenet.util import load_configuration_201
 from hypothesis.nn.densenet.util import load_modules
 from hypothesis.nn.util import compute_dimensionality
+from hypothesis.nn.util import optimize_for_inference
+from hypothesis.nn.util import preserve_buffers
 
 
 
@@ -27,7 +32,8 @@ class DenseNetHead(torch.nn.Module):
         channels=default_channels,
         convolution_bias=default_convolution_bias,
         depth=default_depth,
-        dropout=hypothesis.default.dropout):
+        dropout=hypothesis.default.dropout,
+        memory_efficient=default_memory_efficient):
         super(DenseNetHead, self).__init__()
         # Infer the dimensionality from the input shape.
         self.dimensionality = len(shape_xs)
@@ -44,6 +50,7 @@ class DenseNetHead(torch.nn.Module):
         self.channels = channels
         self.convolution_bias = convolution_bias
         self.in_planes = in_planes
+        self.memory_efficient = memory_efficient
         self.shape_xs = shape_xs
         # Network structure
         self.network_head = self._build_head()
@@ -86,6 +93,7 @@ class DenseNetHead(torch.nn.Module):
                 dimensionality=self.dimensionality,
                 dropout=dropout,
                 growth_rate=growth_rate,
+                memory_efficient=self.memory_efficient,
                 num_input_features=num_features,
                 num_layers=num_layers))
             num_features += num_layers * growth_rate
@@ -140,6 +148,12 @@ class DenseNetHead(torch.nn.Module):
     def embedding_dimensionality(self):
         return self.embedding_dim
 
+    def optimize_for_inference(self, channels_last=True):
+        r"""Folds the batch normalizations into the convolutions and
+        optionally switches to a channels-last memory format. The head
+        should only be used for inference afterwards."""
+        return optimize_for_inference(self, channels_last=channels_last)
+
     def forward(self, x):
         z = self.network_head(x)
         z = self.network_body(z)
@@ -160,6 +174,15 @@ class DenseNetHead(torch.nn.Module):
 
 
 class DenseBlock(torch.nn.Module):
+    r"""Block of densely connected layers.
+
+    In memory-efficient mode, the bottlenecks of the layers are recomputed
+    during the backward pass instead of storing their activations, and the
+    feature maps are written into a single preallocated tensor during
+    inference (without autograd), instead of being concatenated by every
+    layer. The memory footprint of the activations then grows linearly
+    instead of quadratically with the number of layers.
+    """
 
     def __init__(self, dimensionality,
         activation,
@@ -168,8 +191,12 @@ class DenseBlock(torch.nn.Module):
         dropout,
         growth_rate,
         num_input_features,
-        num_layers):
+        num_layers,
+        memory_efficient=default_memory_efficient):
         super(DenseBlock, self).__init__()
+        self.growth_rate = growth_rate
+        self.memory_efficient = memory_efficient
+        self.num_input_features = num_input_features
         # Add the layers to the block.
         self.layers = torch.nn.ModuleList()
         for index in range(num_layers):
@@ -180,9 +207,24 @@ class DenseBlock(torch.nn.Module):
                 dimensionality=dimensionality,
                 dropout=dropout,
                 growth_rate=growth_rate,
+                memory_efficient=memory_efficient,
                 num_input_features=num_input_features + index * growth_rate))
 
+    def _forward_shared_storage(self, x):
+        num_features = self.num_input_features + len(self.layers) * self.growth_rate
+        storage = x.new_empty((x.shape[0], num_features) + x.shape[2:])
+        storage[:, :self.num_input_features] = x
+        offset = self.num_input_features
+        for layer in self.layers:
+            storage[:, offset:offset + self.growth_rate] = layer([storage[:, :offset]])
+            offset += self.growth_rate
+
+        return storage
+
     def forward(self, x):
+        # Check if the features can be stored in shared storage.
+        if self.memory_efficient and not torch.is_grad_enabled():
+            return self._forward_shared_storage(x)
         features = [x]
         for layer in self.layers:
             features.append(layer(features))
@@ -199,7 +241,8 @@ class DenseLayer(torch.nn.Module):
         bottleneck_factor,
         dropout,
         growth_rate,
-        num_input_features):
+        num_input_features,
+        memory_efficient=default_memory_efficient):
         super(DenseLayer, self).__init__()
         # Load the modules depending on the dimensionality
         modules = load_modules(dimensionality)
@@ -208,6 +251,13 @@ class DenseLayer(torch.nn.Module):
         self.module_maxpool = modules[2]
         self.module_average_pooling = modules[3]
         self.module_activation = activation
+        self.memory_efficient = memory_efficient
+        # The bottleneck consists of the (batch normalization,) activation
+        # and convolution preceding the second batch normalization.
+        if batchnorm:
+            self.bottleneck_length = 3
+        else:
+            self.bottleneck_length = 2
         # Construct the dense layer
         self.network_mapping = self._build_mapping(
             batchnorm,
@@ -249,7 +299,30 @@ class DenseLayer(torch.nn.Module):
 
         return torch.nn.Sequential(*mappings)
 
-    def forward(self, x):
-        z = torch.cat(x, dim=1)
+    def _recomputation_contexts(self):
+        # The recomputation should not update the running statistics of
+        # the batch normalization a second time.
+        return contextlib.nullcontext(), preserve_buffers(*self.network_mapping[:self.bottleneck_length])
+
+    def _bottleneck(self, *x):
+        if len(x) > 1:
+            z = torch.cat(x, dim=1)
+        else:
+            z = x[0]
+        for index in range(self.bottleneck_length):
+            z = self.network_mapping[index](z)
 
-        return self.network_mapping(z)
+        return z
+
+    def forward(self, x):
+        # Check if the bottleneck has to be recomputed during backward.
+        if self.memory_efficient and torch.is_grad_enabled() and any(t.requires_grad for t in x):
+            z = torch.utils.checkpoint.checkpoint(self._bottleneck, *x,
+                context_fn=self._recomputation_contexts,
+                use_reentrant=False)
+        else:
+            z = self._bottleneck(*x)
+        for index in range(self.bottleneck_length, len(self.network_mapping)):
+            z = self.network_mapping[index](z)
+
+        return z
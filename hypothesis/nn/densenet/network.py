@@ -7,6 +7,7 @@ from .default import bottleneck_factor as default_bottleneck_factor
 from .default import channels as default_channels
 from .default import convolution_bias as default_convolution_bias
 from .default import depth as default_depth
+from .default import memory_efficient as default_memory_efficient
 from hypothesis.nn import MLP
 from hypothesis.nn.densenet import DenseNetHead
 
@@ -24,6 +25,7 @@ class DenseNet(torch.nn.Module):
         convolution_bias=default_convolution_bias,
         depth=default_depth,
         dropout=hypothesis.default.dropout,
+        memory_efficient=default_memory_efficient,
         trunk_activation=None,
         trunk_dropout=None,
         trunk_layers=hypothesis.default.trunk,
@@ -40,6 +42,7 @@ class DenseNet(torch.nn.Module):
             convolution_bias=convolution_bias,
             depth=depth,
             dropout=dropout,
+            memory_efficient=memory_efficient,
             shape_xs=shape_xs)
         # Compute the embedding dimensionality of the head.
         embedding_dim = self.head.embedding_dimensionality()
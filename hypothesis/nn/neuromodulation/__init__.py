@@ -1,7 +1,11 @@
 from .base import BaseNeuromodulatedModule
 from .base import allocate_neuromodulated_activation
 from .base import list_neuromodulated_modules
+from .base import neuromodulated_forward
+from .controller import DefaultNeuromodulationController
+from .controller import SharedNeuromodulationController
 from .controller import allocate_default_neuromodulation_controller
+from .controller import allocate_shared_neuromodulation_controller
 from .elu import NeuromodulatedELU
 from .relu import NeuromodulatedReLU
 from .selu import NeuromodulatedSELU
@@ -5,12 +5,19 @@ from hypothesis.nn.util import list_modules_with_type
 
 
 
-def allocate_neuromodulated_activation(activation, allocator):
+def allocate_neuromodulated_activation(activation, allocator=None):
+    r"""Allocates a neuromodulated activation type. If no controller
+    allocator is specified, the modulations are expected to be provided
+    by a shared controller, see ``neuromodulated_forward``."""
     class LambdaNeuromodulatedActivation(BaseNeuromodulatedModule):
 
         def __init__(self):
+            if allocator is not None:
+                controller = allocator()
+            else:
+                controller = None
             super(LambdaNeuromodulatedActivation, self).__init__(
-                controller=allocator(),
+                controller=controller,
                 activation=activation)
 
     return LambdaNeuromodulatedActivation
@@ -22,20 +29,67 @@ def list_neuromodulated_modules(module):
     return list_modules_with_type(module, desired_type)
 
 
+def neuromodulated_forward(module, x, context=None, modulations=None):
+    r"""Evaluates the (nested) sequential module with an explicit context.
+
+    The neuromodulated modules are either modulated by their own
+    controller given the context, or by the specified modulations (e.g.,
+    from a shared controller) in the order in which they appear in the
+    module. The modulations are never stored in the modules, such that
+    concurrent evaluations with different contexts are safe.
+    """
+    if modulations is not None:
+        modulations = iter(modulations)
+
+    return _neuromodulated_forward(module, x, context, modulations)
+
+
+def _neuromodulated_forward(module, x, context, modulations):
+    if isinstance(module, BaseNeuromodulatedModule):
+        if modulations is not None:
+            return module.modulate(x, next(modulations))
+        else:
+            return module(x, context=context)
+    elif isinstance(module, torch.nn.Sequential):
+        for child in module:
+            x = _neuromodulated_forward(child, x, context, modulations)
+
+        return x
+    else:
+        return module(x)
+
+
 
 class BaseNeuromodulatedModule(torch.nn.Module):
+    r"""Activation modulated by a controller given a context.
+
+    The modulation is computed from the context passed to ``forward``
+    and is not stored in the module. Without context, the activation is
+    modulated by the ``bias`` buffer, which is only set by ``update``.
+    """
 
     def __init__(self, controller, activation=hypothesis.default.activation, **kwargs):
         super(BaseNeuromodulatedModule, self).__init__()
         self.activation = activation(**kwargs)
-        self.bias = torch.randn(1, 1)
+        self.register_buffer("bias", torch.randn(1, 1), persistent=False)
         self.controller = controller
 
     def forward(self, x, context=None):
         if context is not None:
-            self.update(context)
+            return self.modulate(x, self.controller(context))
 
         return self.activation(x + self.bias)
 
+    def modulate(self, x, modulation):
+        r"""Applies the activation with the specified modulation, either
+        a scalar or a per-unit modulation for every sample."""
+        return self.activation(x + modulation)
+
     def update(self, context):
+        r"""Stores the modulation of the specified context in ``bias``.
+
+        Note:
+            The module is stateful afterwards, prefer passing the context
+            to ``forward`` or ``neuromodulated_forward``.
+        """
         self.bias = self.controller(context)
@@ -17,6 +17,18 @@ def allocate_default_neuromodulation_controller(shape_context,
         layers=layers)
 
 
+def allocate_shared_neuromodulation_controller(shape_context, features,
+    activation=hypothesis.default.activation,
+    dropout=hypothesis.default.dropout,
+    layers=hypothesis.default.trunk):
+    return SharedNeuromodulationController(
+        shape_context=shape_context,
+        features=features,
+        activation=activation,
+        dropout=dropout,
+        layers=layers)
+
+
 
 class DefaultNeuromodulationController(torch.nn.Module):
 
@@ -35,3 +47,31 @@ class DefaultNeuromodulationController(torch.nn.Module):
 
     def forward(self, x):
         return self.mlp(x)
+
+
+
+class SharedNeuromodulationController(torch.nn.Module):
+    r"""Maps the context to the per-unit modulations of all neuromodulated
+    activations of a network in a single pass.
+
+    :param shape_context: Shape of the context.
+    :param features: Number of units of every neuromodulated activation,
+                     in the order in which the activations are applied.
+    """
+
+    def __init__(self, shape_context, features,
+        activation=hypothesis.default.activation,
+        dropout=hypothesis.default.dropout,
+        layers=hypothesis.default.trunk):
+        super(SharedNeuromodulationController, self).__init__()
+        self.features = [int(f) for f in features]
+        self.mlp = MLP(
+            shape_xs=shape_context,
+            shape_ys=(sum(self.features),),
+            activation=activation,
+            dropout=dropout,
+            layers=layers,
+            transform_output=None)
+
+    def forward(self, x):
+        return torch.split(self.mlp(x), self.features, dim=1)
@@ -21,3 +21,7 @@ r"""Default group width."""
 
 groups = 1
 r"""Default number of concurrent convolutional groups."""
+
+checkpoint_segments = 0
+r"""Default number of checkpointed segments per stage (0 disables
+activation checkpointing)."""
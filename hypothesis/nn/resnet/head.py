@@ -6,6 +6,7 @@ import torch
 
 from .default import batchnorm as default_batchnorm
 from .default import channels as default_channels
+from .default import checkpoint_segments as default_checkpoint_segments
 from .default import convolution_bias as default_convolution_bias
 from .default import depth as default_depth
 from .default import dilate as default_dilate
@@ -13,18 +14,29 @@ from .default import groups as default_groups
 from .default import in_planes as default_in_planes
 from .default import width_per_group as default_width_per_group
 from hypothesis.nn.resnet.util import load_modules
+from hypothesis.nn.util import CheckpointedSequential
 from hypothesis.nn.util import compute_dimensionality
+from hypothesis.nn.util import optimize_for_inference
 
 
 
 
 class ResNetHead(torch.nn.Module):
+    r"""Convolutional ResNet head.
+
+    Setting ``checkpoint_segments`` enables activation checkpointing: the
+    blocks of every stage are split in the specified number of segments,
+    and only the inputs of the segments are stored during training. The
+    other activations are recomputed during the backward pass, trading
+    compute for memory.
+    """
 
     def __init__(self,
         shape_xs,
         activation=hypothesis.default.activation,
         batchnorm=default_batchnorm,
         channels=default_channels,
+        checkpoint_segments=default_checkpoint_segments,
         convolution_bias=default_convolution_bias,
         depth=default_depth,
         dilate=default_dilate,
@@ -44,6 +56,7 @@ class ResNetHead(torch.nn.Module):
         # Network properties.
         self.batchnorm = batchnorm
         self.channels = channels
+        self.checkpoint_segments = checkpoint_segments
         self.convolution_bias = convolution_bias
         self.dilate = dilate
         self.dilation = 1
@@ -136,7 +149,7 @@ class ResNetHead(torch.nn.Module):
                 out_planes=planes,
                 width_per_group=self.width_per_group))
 
-        return torch.nn.Sequential(*mappings)
+        return CheckpointedSequential(*mappings, segments=self.checkpoint_segments)
 
     def _load_configuration(self, depth):
         modules = load_modules(self.dimensionality)
@@ -166,6 +179,12 @@ class ResNetHead(torch.nn.Module):
     def embedding_dimensionality(self):
         return self.embedding_dim
 
+    def optimize_for_inference(self, channels_last=True):
+        r"""Folds the batch normalizations into the convolutions and
+        optionally switches to a channels-last memory format. The head
+        should only be used for inference afterwards."""
+        return optimize_for_inference(self, channels_last=channels_last)
+
     def forward(self, x):
         x = x.view(self.shape_in)
         z = self.network_head(x)
@@ -4,6 +4,7 @@ import torch
 
 from .default import batchnorm as default_batchnorm
 from .default import channels as default_channels
+from .default import checkpoint_segments as default_checkpoint_segments
 from .default import convolution_bias as default_convolution_bias
 from .default import depth as default_depth
 from .default import dilate as default_dilate
@@ -23,6 +24,7 @@ class ResNet(torch.nn.Module):
         activation=hypothesis.default.activation,
         batchnorm=default_batchnorm,
         channels=default_channels,
+        checkpoint_segments=default_checkpoint_segments,
         convolution_bias=default_convolution_bias,
         depth=default_depth,
         dilate=default_dilate,
@@ -41,6 +43,7 @@ class ResNet(torch.nn.Module):
             activation=hypothesis.default.activation,
             batchnorm=batchnorm,
             channels=channels,
+            checkpoint_segments=checkpoint_segments,
             convolution_bias=convolution_bias,
             depth=depth,
             dilate=dilate,
@@ -1,10 +1,44 @@
 r"""Utilities for hypothesis.nn."""
 
+import contextlib
 import hypothesis
 import numpy as np
 import torch
+import torch.utils.checkpoint
 
 from hypothesis.util import is_iterable
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+
+
+
+class CheckpointedSequential(torch.nn.Sequential):
+    r"""Sequential mapping which, during training, splits its modules in
+    the specified number of segments and only stores the inputs of every
+    segment. The activations within a segment are recomputed during the
+    backward pass. The running statistics of batch normalizations are not
+    affected by the recomputation.
+
+    :param segments: Number of checkpointed segments, checkpointing is
+                     disabled if 0.
+    """
+
+    def __init__(self, *modules, segments=0):
+        super(CheckpointedSequential, self).__init__(*modules)
+        self.segments = min(int(segments), len(modules))
+
+    def forward(self, x):
+        # Check if activations are stored for a backward pass.
+        if self.segments == 0 or not self.training or not torch.is_grad_enabled():
+            return super(CheckpointedSequential, self).forward(x)
+        modules = list(self)
+        size = -(-len(modules) // self.segments)
+        for start in range(0, len(modules), size):
+            segment = torch.nn.Sequential(*modules[start:start + size])
+            x = torch.utils.checkpoint.checkpoint(segment, x,
+                context_fn=_recomputation_contexts(segment),
+                use_reentrant=False)
+
+        return x
 
 
 
@@ -40,3 +74,108 @@ def list_modules_with_type(module, type):
             selected_modules.append(m)
 
     return selected_modules
+
+
+@contextlib.contextmanager
+def preserve_buffers(*modules):
+    r"""Restores the buffers (e.g., running statistics) of the specified
+    modules on exit."""
+    buffers = [b for m in modules for b in m.buffers()]
+    state = [b.clone() for b in buffers]
+    try:
+        yield
+    finally:
+        with torch.no_grad():
+            for buffer, value in zip(buffers, state):
+                buffer.copy_(value)
+
+
+@contextlib.contextmanager
+def evaluation_mode(*modules, device=None):
+    r"""Puts the specified modules in evaluation mode, and optionally moves
+    them to ``device``. Their modes and devices are restored on exit."""
+    modes = [(m, m.training) for module in modules for m in module.modules()]
+    devices = []
+    for module in modules:
+        tensor = next(iter(list(module.parameters()) + list(module.buffers())), None)
+        if tensor is not None:
+            devices.append((module, tensor.device))
+    try:
+        for module in modules:
+            if device is not None:
+                module.to(device)
+            module.eval()
+        yield
+    finally:
+        for module, module_device in reversed(devices):
+            module.to(module_device)
+        for m, training in modes:
+            m.training = training
+
+
+@torch.no_grad()
+def to_channels_last(module):
+    r"""Converts the 2-D and 3-D convolutional kernels of the specified module
+    to a channels-last memory format. Other parameters are left untouched."""
+    memory_formats = {
+        4: torch.channels_last,
+        5: torch.channels_last_3d}
+    for parameter in module.parameters():
+        memory_format = memory_formats.get(parameter.dim())
+        if memory_format is not None:
+            parameter.data = parameter.data.contiguous(memory_format=memory_format)
+
+    return module
+
+
+@torch.no_grad()
+def optimize_for_inference(module, channels_last=True):
+    r"""Optimizes the specified module for inference, in place.
+
+    Batch normalizations directly following a convolution in a sequential
+    mapping are folded into the convolution, activations following a
+    convolution or a batch normalization are applied in place, and the
+    convolutional kernels are optionally converted to a channels-last
+    memory format. The module is put in evaluation mode.
+
+    Note:
+        The folded batch normalizations are removed, the module should not
+        be trained afterwards.
+    """
+    module.eval()
+    for sequential in list_modules_with_type(module, torch.nn.Sequential):
+        _inplace_activations(sequential)
+        _fuse_convolutions_and_batchnorms(sequential)
+    if channels_last:
+        to_channels_last(module)
+
+    return module
+
+
+def _recomputation_contexts(*modules):
+    return lambda: (contextlib.nullcontext(), preserve_buffers(*modules))
+
+
+_convolutions = (torch.nn.Conv1d, torch.nn.Conv2d, torch.nn.Conv3d)
+
+_batchnorms = (torch.nn.BatchNorm1d, torch.nn.BatchNorm2d, torch.nn.BatchNorm3d)
+
+
+def _inplace_activations(sequential):
+    # The outputs of convolutions and batch normalizations are temporaries.
+    names = list(sequential._modules.keys())
+    for previous, current in zip(names[:-1], names[1:]):
+        previous = sequential._modules[previous]
+        current = sequential._modules[current]
+        if isinstance(previous, _convolutions + _batchnorms) and hasattr(current, "inplace"):
+            current.inplace = True
+
+
+def _fuse_convolutions_and_batchnorms(sequential):
+    names = list(sequential._modules.keys())
+    for name_convolution, name_batchnorm in zip(names[:-1], names[1:]):
+        convolution = sequential._modules[name_convolution]
+        batchnorm = sequential._modules[name_batchnorm]
+        if isinstance(convolution, _convolutions) and isinstance(batchnorm, _batchnorms) and batchnorm.track_running_stats:
+            sequential._modules[name_convolution] = fuse_conv_bn_eval(convolution, batchnorm)
+            sequential._modules[name_batchnorm] = torch.nn.Identity()
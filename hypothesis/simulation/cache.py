@@ -0,0 +1,221 @@
+import hashlib
+import numpy as np
+import os
+import random
+import threading
+import torch
+
+from collections import OrderedDict
+from hypothesis.simulation.base import Simulator
+
+
+
+class CachedSimulator(Simulator):
+    r"""Caches the outputs of a simulator.
+
+    Calls are identified by a hash of their arguments and of an explicit
+    seed, with which the random number generators are seeded during the
+    simulation. The seed is not part of the key of deterministic
+    simulators. Calls of stochastic simulators without a seed are not
+    cached, as their outputs are not reproducible.
+
+    Outputs are kept in an in-memory LRU cache bounded by ``capacity``
+    bytes, and, optionally, in a directory which persists across runs.
+
+    Example usage::
+
+        simulator = CachedSimulator(MySimulator(), directory="cache")
+        outputs = simulator(inputs, seed=42)
+        print(simulator.statistics())
+
+    :param simulator: The simulator to cache.
+    :param capacity: Maximum number of bytes of cached outputs in memory.
+    :param directory: Directory of the on-disk cache (default: none).
+    :param deterministic: Whether the outputs of the simulator only
+                          depend on its arguments.
+    :param seed: Default seed of calls which do not specify one
+                 (default: none).
+    """
+
+    def __init__(self, simulator, capacity=256 * 2 ** 20, directory=None, deterministic=False, seed=None):
+        super(CachedSimulator, self).__init__()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        self.bypasses = 0
+        self.capacity = capacity
+        self.deterministic = deterministic
+        self.directory = directory
+        self.disk_hits = 0
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.lock = threading.Lock()
+        self.misses = 0
+        self.seed = seed
+        self.simulator = simulator
+        self.size = 0
+
+    def _key(self, seed, args, kwargs):
+        digest = hashlib.sha256()
+        _update_digest(digest, args)
+        _update_digest(digest, sorted(kwargs.items()))
+        if not self.deterministic:
+            _update_digest(digest, seed)
+
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".pt")
+
+    def _lookup(self, key):
+        with self.lock:
+            outputs = self.entries.get(key)
+            if outputs is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return outputs
+        # Check the on-disk cache.
+        if self.directory is not None and os.path.exists(self._path(key)):
+            outputs = torch.load(self._path(key), map_location="cpu", weights_only=False)
+            with self.lock:
+                self.disk_hits += 1
+            self._store_memory(key, outputs)
+            return outputs
+
+        return None
+
+    def _store(self, key, outputs):
+        self._store_memory(key, outputs)
+        if self.directory is not None:
+            path = self._path(key)
+            # Unique for every process and thread writing the same entry.
+            temporary_path = path + ".{}.{}.tmp".format(os.getpid(), threading.get_ident())
+            torch.save(outputs, temporary_path)
+            os.replace(temporary_path, path)
+
+    def _store_memory(self, key, outputs):
+        size = _nbytes(outputs)
+        with self.lock:
+            if key in self.entries.keys() or size > self.capacity:
+                return
+            self.entries[key] = outputs
+            self.size += size
+            while self.size > self.capacity:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= _nbytes(evicted)
+
+    def _simulate(self, seed, args, kwargs):
+        if seed is None:
+            return self.simulator(*args, **kwargs)
+        # Seed the simulation without affecting the global random state.
+        numpy_state = np.random.get_state()
+        python_state = random.getstate()
+        try:
+            # The CUDA generators are seeded as well and have to be restored.
+            devices = list(range(torch.cuda.device_count())) if torch.cuda.is_available() else []
+            with torch.random.fork_rng(devices=devices):
+                random.seed(seed)
+                np.random.seed(seed)
+                torch.manual_seed(seed)
+                outputs = self.simulator(*args, **kwargs)
+        finally:
+            np.random.set_state(numpy_state)
+            random.setstate(python_state)
+
+        return outputs
+
+    def clear(self):
+        r"""Clears the in-memory cache and the statistics."""
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+            self.bypasses = 0
+            self.disk_hits = 0
+            self.hits = 0
+            self.misses = 0
+
+    @torch.no_grad()
+    def forward(self, *args, seed=None, **kwargs):
+        if seed is None:
+            seed = self.seed
+        # Check if the outputs of the call are reproducible.
+        if seed is None and not self.deterministic:
+            with self.lock:
+                self.bypasses += 1
+            return self.simulator(*args, **kwargs)
+        key = self._key(seed, args, kwargs)
+        outputs = self._lookup(key)
+        if outputs is None:
+            with self.lock:
+                self.misses += 1
+            outputs = _detach(self._simulate(seed, args, kwargs))
+            self._store(key, outputs)
+
+        return _clone(outputs) # Protects the cache against in-place changes.
+
+    def hit_rate(self):
+        r"""Fraction of the cacheable calls served from the cache."""
+        calls = self.hits + self.disk_hits + self.misses
+        if calls == 0:
+            return 0.0
+
+        return (self.hits + self.disk_hits) / calls
+
+    def statistics(self):
+        return {
+            "bypasses": self.bypasses,
+            "disk_hits": self.disk_hits,
+            "hit_rate": self.hit_rate(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": self.size}
+
+    def terminate(self):
+        if hasattr(self, "simulator"):
+            self.simulator.terminate()
+
+
+
+def _update_digest(digest, value):
+    if isinstance(value, torch.Tensor):
+        value = value.detach().cpu().contiguous()
+        digest.update(str((value.dtype, tuple(value.shape))).encode("utf-8"))
+        digest.update(value.view(-1).view(torch.uint8).numpy().tobytes())
+    elif isinstance(value, np.ndarray):
+        digest.update(str((value.dtype, value.shape)).encode("utf-8"))
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, (list, tuple)):
+        digest.update(b"(")
+        for item in value:
+            _update_digest(digest, item)
+        digest.update(b")")
+    else:
+        digest.update(repr(value).encode("utf-8"))
+
+
+def _nbytes(value):
+    if isinstance(value, (torch.Tensor, np.ndarray)):
+        return value.nbytes
+    elif isinstance(value, (list, tuple)):
+        return sum(_nbytes(item) for item in value)
+    else:
+        return 0
+
+
+def _detach(value):
+    if isinstance(value, torch.Tensor):
+        return value.detach().cpu()
+    elif isinstance(value, (list, tuple)):
+        return type(value)(_detach(item) for item in value)
+    else:
+        return value
+
+
+def _clone(value):
+    if isinstance(value, torch.Tensor):
+        return value.clone()
+    elif isinstance(value, np.ndarray):
+        return value.copy()
+    elif isinstance(value, (list, tuple)):
+        return type(value)(_clone(item) for item in value)
+    else:
+        return value
@@ -7,43 +7,68 @@ from scipy.stats import chi2
 
 
 @torch.no_grad()
-def highest_density_region(pdf, alpha, bias=0.0, min_epsilon=10e-17):
-    _, mask = highest_density_level(pdf, alpha, bias=bias, min_epsilon=min_epsilon, region=True)
+def highest_density_region(pdf, alpha, bias=0.0, min_epsilon=10e-17, batched=False):
+    _, mask = highest_density_level(pdf, alpha, bias=bias, min_epsilon=min_epsilon, region=True, batched=batched)
 
     return mask
 
 
 @torch.no_grad()
-def highest_density_level(pdf, alpha, bias=0.0, min_epsilon=10e-17, region=False):
+def highest_density_level(pdf, alpha, bias=0.0, min_epsilon=10e-17, region=False, batched=False):
+    r"""Computes the density level of the highest density region with
+    (at least) probability mass ``alpha + bias``.
+
+    The level is the largest density value for which the mass of the
+    region ``pdf >= level`` exceeds ``alpha + bias``, it is obtained
+    exactly by sorting the (unnormalized) densities. The computation is
+    performed on the device of ``pdf``.
+
+    :param pdf: Densities evaluated on a grid, a numpy array or a tensor.
+    :param batched: Treats the first dimension of ``pdf`` as a batch of
+                    independent grids.
+    :param region: Also returns the mask of the highest density region.
+    :param min_epsilon: Unused, the level is exact.
+    :return: The level, a float or a tensor of levels if ``batched``, and
+             optionally the (batch of) float mask(s).
+    """
     # Check if a proper bias has been specified.
     if bias >= alpha:
         raise ValueError("The bias cannot be larger or equal to the specified alpha level.")
     # Detect numpy type
-    if type(pdf).__module__ != np.__name__:
-        pdf = pdf.cpu().clone().numpy()
-    else:
-        pdf = np.array(pdf)
-    total_pdf = pdf.sum()
-    pdf /= total_pdf
-    # Compute highest density level and the corresponding mask
-    n = len(pdf)
-    optimal_level = pdf.max().item()
-    epsilon = 10e-02
-    while epsilon >= min_epsilon:
-        area = float(0)
-        while area <= (alpha + bias):
-            # Compute the integral
-            m = (pdf >= optimal_level).astype(np.float32)
-            area = np.sum(m * pdf)
-            # Compute the error and apply gradient descent
-            optimal_level -= epsilon
-        optimal_level += 2 * epsilon
-        epsilon /= 10
-    optimal_level *= total_pdf
+    if type(pdf).__module__ == np.__name__:
+        pdf = torch.from_numpy(np.asarray(pdf))
+    if not batched:
+        pdf = pdf.unsqueeze(0)
+    shape = pdf.shape
+    pdf = pdf.reshape(shape[0], -1)
+    # Accumulate the normalized densities in decreasing order.
+    sorted_pdf = _sort_descending(pdf)
+    cumulative = torch.cumsum(sorted_pdf.double(), dim=1)
+    cumulative /= cumulative[:, -1:].clone()
+    # The level is the density at which the accumulated mass first
+    # exceeds the target.
+    target = torch.full((shape[0], 1), alpha + bias, dtype=cumulative.dtype, device=cumulative.device)
+    indices = torch.searchsorted(cumulative, target, right=True).clamp_(max=pdf.shape[1] - 1)
+    levels = sorted_pdf.gather(1, indices)
+    if region:
+        mask = (pdf >= levels).float().view(shape)
+    levels = levels.view(-1)
+    if not batched:
+        levels = levels.item()
+        if region:
+            mask = mask.squeeze(0)
     if region:
-        return optimal_level, torch.from_numpy(m)
+        return levels, mask
+    else:
+        return levels
+
+
+def _sort_descending(pdf):
+    # The sort of numpy is considerably faster on the CPU.
+    if pdf.device.type == "cpu":
+        return torch.from_numpy(np.ascontiguousarray(np.sort(pdf.detach().numpy(), axis=1)[:, ::-1]))
     else:
-        return optimal_level
+        return torch.sort(pdf, dim=1, descending=True).values
 
 
 @torch.no_grad()
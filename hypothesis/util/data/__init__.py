@@ -4,4 +4,5 @@ r""""""
 
 from hypothesis.util.data.distribution_dataset import DistributionDataset
 from hypothesis.util.data.simulation_tensor_dataset import SimulationTensorDataset
+from hypothesis.util.data.simulator_dataset import BatchSimulatorDataset
 from hypothesis.util.data.simulator_dataset import SimulatorDataset
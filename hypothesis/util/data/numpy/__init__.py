@@ -1,5 +1,7 @@
+from .storage import ChunkedStorage
 from .storage import InMemoryStorage
 from .storage import PersistentStorage
+from .storage import ShardedStorage
 from .simulation_dataset import SimulationDataset
 from .util import compute_final_shape
 from .util import merge
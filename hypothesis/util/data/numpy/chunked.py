@@ -0,0 +1,227 @@
+r"""Chunked and compressed storage format for numpy arrays (``.npc``).
+
+An ``.npc`` file stores the rows of an array in chunks of a fixed number of
+rows, every chunk is compressed independently. The data can be stored in a
+smaller data type (e.g., ``uint8`` for binary masks, or ``float16``), and is
+cast back to the original data type on read. A JSON index at the end of the
+file records the offset and size of every chunk, which allows for random
+access without decompressing the complete file.
+
+Layout: magic, chunks, index, length of the index (8 bytes, little endian).
+"""
+
+import bz2
+import json
+import lzma
+import numpy as np
+import os
+import struct
+import threading
+import zlib
+
+from collections import OrderedDict
+
+
+extension = ".npc"
+
+magic = b"\x93HYPNPC\x01"
+
+codecs = {
+    "bz2": (bz2.compress, bz2.decompress),
+    "lzma": (lzma.compress, lzma.decompress),
+    "none": (bytes, bytes),
+    "zlib": (zlib.compress, zlib.decompress)}
+
+try:
+    import lz4.frame
+    codecs["lz4"] = (lz4.frame.compress, lz4.frame.decompress)
+except ImportError:
+    pass # Optional codec.
+
+
+
+class ChunkCache:
+    r"""Thread-safe LRU cache of decompressed chunks, bounded by the total
+    number of bytes of the cached chunks."""
+
+    def __init__(self, capacity=256 * 2 ** 20):
+        self.capacity = capacity
+        self.chunks = OrderedDict()
+        self.hits = 0
+        self.lock = threading.Lock()
+        self.misses = 0
+        self.size = 0
+
+    def clear(self):
+        with self.lock:
+            self.chunks.clear()
+            self.size = 0
+
+    def get(self, key, load):
+        r"""Retrieves the chunk with the specified key, the chunk is loaded
+        by calling ``load`` whenever it is not cached."""
+        with self.lock:
+            chunk = self.chunks.get(key)
+            if chunk is not None:
+                self.chunks.move_to_end(key)
+                self.hits += 1
+                return chunk
+            self.misses += 1
+        chunk = load() # Decompress outside of the lock.
+        with self.lock:
+            if key not in self.chunks and chunk.nbytes <= self.capacity:
+                self.chunks[key] = chunk
+                self.size += chunk.nbytes
+                while self.size > self.capacity:
+                    _, evicted = self.chunks.popitem(last=False)
+                    self.size -= evicted.nbytes
+
+        return chunk
+
+    def __getstate__(self):
+        # Processes receiving the cache start with an empty cache.
+        return {"capacity": self.capacity}
+
+    def __setstate__(self, state):
+        self.__init__(state["capacity"])
+
+
+cache = ChunkCache() # Shared by all readers of a process.
+
+
+
+class ChunkedWriter:
+    r"""Writes an ``.npc`` file by appending rows.
+
+    :param path: Path of the file.
+    :param dtype: Data type of the rows.
+    :param storage_dtype: Data type in which the rows are stored
+                          (default: the data type of the rows). Casts to
+                          integral data types are verified to be exact.
+    :param codec: Compression codec, see ``codecs``.
+    :param chunk_size: Number of rows per chunk.
+    :param level: Compression level of the codec.
+    """
+
+    def __init__(self, path, dtype, storage_dtype=None, codec="zlib", chunk_size=1024, level=None):
+        if codec not in codecs.keys():
+            raise ValueError("The codec", codec, "is not available.")
+        if storage_dtype is None:
+            storage_dtype = dtype
+        self.buffer = []
+        self.buffered = 0
+        self.chunk_size = chunk_size
+        self.codec = codec
+        self.dtype = np.dtype(dtype)
+        self.fd = open(path, "wb")
+        self.fd.write(magic)
+        self.level = level
+        self.offsets = []
+        self.row_shape = None
+        self.rows = 0
+        self.sizes = []
+        self.storage_dtype = np.dtype(storage_dtype)
+
+    def _compress(self, data):
+        compress, _ = codecs[self.codec]
+        if self.level is not None and self.codec != "none":
+            return compress(data, self.level)
+        else:
+            return compress(data)
+
+    def _cast(self, rows):
+        stored = rows.astype(self.storage_dtype)
+        # Check if a cast to an integral type lost information.
+        if self.storage_dtype.kind in "biu" and not np.array_equal(stored, rows):
+            raise ValueError("The data cannot be represented exactly as", self.storage_dtype)
+
+        return stored
+
+    def _flush(self, final=False):
+        if self.buffered < self.chunk_size and not (final and self.buffered > 0):
+            return
+        # The buffered rows are concatenated once, the chunks are views.
+        rows = np.concatenate(self.buffer)
+        offset = 0
+        while len(rows) - offset >= self.chunk_size or (final and offset < len(rows)):
+            chunk = rows[offset:offset + self.chunk_size]
+            compressed = self._compress(np.ascontiguousarray(self._cast(chunk)).tobytes())
+            self.offsets.append(self.fd.tell())
+            self.sizes.append(len(compressed))
+            self.fd.write(compressed)
+            offset += len(chunk)
+        # Only the incomplete tail remains buffered.
+        self.buffer = [rows[offset:].copy()]
+        self.buffered = len(rows) - offset
+
+    def close(self):
+        if self.fd is None:
+            return
+        self._flush(final=True)
+        if self.row_shape is None:
+            self.row_shape = ()
+        index = {
+            "chunk_size": self.chunk_size,
+            "codec": self.codec,
+            "dtype": self.dtype.str,
+            "offsets": self.offsets,
+            "shape": [self.rows] + list(self.row_shape),
+            "sizes": self.sizes,
+            "storage_dtype": self.storage_dtype.str}
+        index = json.dumps(index).encode("utf-8")
+        self.fd.write(index)
+        self.fd.write(struct.pack("<Q", len(index)))
+        self.fd.close()
+        self.fd = None
+
+    def write(self, rows):
+        rows = np.asarray(rows, dtype=self.dtype)
+        # Check if the shape of the rows is consistent.
+        if self.row_shape is None:
+            self.row_shape = rows.shape[1:]
+        elif rows.shape[1:] != self.row_shape:
+            raise ValueError("Expected rows of shape", self.row_shape, "got", rows.shape[1:])
+        self.buffer.append(rows)
+        self.buffered += len(rows)
+        self.rows += len(rows)
+        self._flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+
+def read_index(path):
+    r"""Reads the chunk index of the specified ``.npc`` file."""
+    with open(path, "rb") as fd:
+        if fd.read(len(magic)) != magic:
+            raise ValueError("The file", path, "is not a chunked array.")
+        fd.seek(-8, os.SEEK_END)
+        length = struct.unpack("<Q", fd.read(8))[0]
+        fd.seek(-8 - length, os.SEEK_END)
+        index = json.loads(fd.read(length).decode("utf-8"))
+    index["dtype"] = np.dtype(index["dtype"])
+    index["shape"] = tuple(index["shape"])
+    index["storage_dtype"] = np.dtype(index["storage_dtype"])
+
+    return index
+
+
+def decompress(data, codec):
+    _, decompress = codecs[codec]
+
+    return decompress(data)
+
+
+def compress(input_file, output_file, storage_dtype=None, codec="zlib", chunk_size=1024, level=None):
+    r"""Converts the specified ``.npy`` file into an ``.npc`` file, the
+    input file is streamed through a memory map."""
+    data = np.load(input_file, mmap_mode="r")
+    with ChunkedWriter(output_file, data.dtype, storage_dtype=storage_dtype,
+        codec=codec, chunk_size=chunk_size, level=level) as writer:
+        for start in range(0, len(data), chunk_size):
+            writer.write(data[start:start + chunk_size])
+    del data
@@ -2,35 +2,55 @@ import numpy as np
 import os
 import torch
 
-from hypothesis.util.data.numpy import InMemoryStorage
-from hypothesis.util.data.numpy import PersistentStorage
+from hypothesis.util.data.numpy.storage import allocate_storage
 from torch.utils.data import Dataset as BaseDataset
 
 
 
 class Dataset(BaseDataset):
-    r""""""
+    r"""Dataset backed by one or more ``.npy`` files.
+
+    Every path can also be a glob pattern (or a list of paths) of shards,
+    which are presented as a single, appendable file without merging them
+    (see ``ShardedStorage``).
+    """
 
     def __init__(self, *paths, in_memory=True):
         super(Dataset, self).__init__()
-        if in_memory:
-            storage_type = InMemoryStorage
-        else:
-            storage_type = PersistentStorage
         if len(paths) > 1:
-            self.storages = [storage_type(path) for path in paths]
+            self.storages = [allocate_storage(path, in_memory) for path in paths]
             self.retriever = self._retrieve_multi_storage
+            self.batch_retriever = self._retrieve_multi_storage_batch
         else:
-            self.storage = storage_type(paths[0])
+            self.storage = allocate_storage(paths[0], in_memory)
             self.retriever = self._retrieve_single_storage
+            self.batch_retriever = self._retrieve_single_storage_batch
             self.storages = [self.storage]
 
     def _retrieve_multi_storage(self, index):
         return tuple(storage[index].unsqueeze(0) for storage in self.storages)
 
+    def _retrieve_multi_storage_batch(self, indices):
+        # Matches the shapes of the collated items.
+        return tuple(storage.get_batch(indices).unsqueeze(1) for storage in self.storages)
+
     def _retrieve_single_storage(self, index):
         return self.storage[index]
 
+    def _retrieve_single_storage_batch(self, indices):
+        return self.storage.get_batch(indices)
+
+    def get_batch(self, indices):
+        r"""Retrieves the rows with the specified indices as a single batch."""
+        return self.batch_retriever(indices)
+
+    def refresh(self):
+        r"""Picks up the shards which were appended since the dataset was
+        allocated."""
+        for storage in self.storages:
+            if hasattr(storage, "refresh"):
+                storage.refresh()
+
     def __getitem__(self, index):
         return self.retriever(index)
 
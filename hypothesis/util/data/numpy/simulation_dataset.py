@@ -3,8 +3,7 @@ import os
 import torch
 
 from torch.utils.data import Dataset
-from hypothesis.util.data.numpy import InMemoryStorage
-from hypothesis.util.data.numpy import PersistentStorage
+from hypothesis.util.data.numpy.storage import allocate_storage
 
 
 
@@ -13,12 +12,15 @@ class SimulationDataset(Dataset):
 
     def __init__(self, inputs, outputs, in_memory=False):
         super(SimulationDataset, self).__init__()
-        if in_memory:
-            self.storage_inputs = InMemoryStorage(inputs)
-            self.storage_outputs = InMemoryStorage(outputs)
-        else:
-            self.storage_inputs = PersistentStorage(inputs)
-            self.storage_outputs = PersistentStorage(outputs)
+        self.storage_inputs = allocate_storage(inputs, in_memory)
+        self.storage_outputs = allocate_storage(outputs, in_memory)
+
+    def refresh(self):
+        r"""Picks up the shards which were appended since the dataset was
+        allocated."""
+        for storage in (self.storage_inputs, self.storage_outputs):
+            if hasattr(storage, "refresh"):
+                storage.refresh()
 
     def __len__(self):
         return len(self.storage_inputs)
@@ -35,3 +37,10 @@ class SimulationDataset(Dataset):
         outputs = self.storage_outputs[index]
 
         return inputs, outputs
+
+    def get_batch(self, indices):
+        r""""""
+        inputs = self.storage_inputs.get_batch(indices)
+        outputs = self.storage_outputs.get_batch(indices)
+
+        return inputs, outputs
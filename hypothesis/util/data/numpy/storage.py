@@ -1,6 +1,11 @@
+import glob
 import numpy as np
 import os
 import torch
+import warnings
+
+from hypothesis.util.data.numpy import chunked
+from hypothesis.util.data.numpy.util import load_header
 
 
 class BaseStorage:
@@ -8,6 +13,9 @@ class BaseStorage:
     def close(self):
         raise NotImplementedError
 
+    def get_batch(self, indices):
+        raise NotImplementedError
+
     def __len__(self):
         raise NotImplementedError
 
@@ -17,6 +25,15 @@ class BaseStorage:
     def __del__(self):
         self.close()
 
+    @staticmethod
+    def _selection(indices):
+        r"""Reduces the indices to a slice if they form a contiguous range."""
+        indices = np.asarray(indices, dtype=np.int64)
+        if len(indices) > 0 and indices[-1] - indices[0] == len(indices) - 1 and np.all(np.diff(indices) == 1):
+            return slice(int(indices[0]), int(indices[-1]) + 1)
+        else:
+            return indices
+
 
 class InMemoryStorage(BaseStorage):
 
@@ -34,14 +51,23 @@ class InMemoryStorage(BaseStorage):
             del self.data
             self.data = None
 
+    def get_batch(self, indices):
+        return as_tensor(self.data[self._selection(indices)])
+
     def __len__(self):
         return len(self.data)
 
     def __getitem__(self, index):
-        return torch.from_numpy(self.data[index])
+        return as_tensor(self.data[index])
 
 
 class PersistentStorage(BaseStorage):
+    r"""Storage backed by a memory-mapped ``.npy`` file.
+
+    The file is mapped lazily, once per process. Data loader workers
+    therefore map the file after they have been forked, and share the
+    operating system page cache. Items and slices are zero-copy views.
+    """
 
     def __init__(self, path):
         super(PersistentStorage, self).__init__()
@@ -50,60 +76,246 @@ class PersistentStorage(BaseStorage):
             raise ValueError("The path", path, "does not exists.")
         # Storage properties.
         self.path = path
-        self.fd = open(self.path, "rb")
-        self.header, self.offset = self._parse_header(self.fd)
-        self.fd.close()
+        self.data = None
+        self.pid = None
+        self.shape, self.fortran_order, self.dtype, self.offset = load_header(path)
+        self.size = self.shape[0]
+
+    def _map(self):
+        pid = os.getpid()
+        # Check if the file has to be mapped in the current process.
+        if self.data is None or self.pid != pid:
+            self.data = np.load(self.path, mmap_mode="r")
+            self.pid = pid
+
+        return self.data
+
+    def close(self):
+        self.data = None
+        self.pid = None
+
+    def get_batch(self, indices):
+        return as_tensor(self._map()[self._selection(indices)])
+
+    def __getitem__(self, index):
+        return as_tensor(self._map()[index])
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["data"] = None # Mapped again by the receiving process.
+        state["pid"] = None
+
+        return state
+
+    def __len__(self):
+        return self.size
+
+
+
+def as_tensor(data):
+    r"""Converts the (memory-mapped) array to a tensor without copying it,
+    unless the byte order of the data is not native."""
+    data = np.asarray(data)
+    if not data.dtype.isnative:
+        data = data.astype(data.dtype.newbyteorder("="))
+    with warnings.catch_warnings():
+        # Memory-mapped arrays are read-only, but never written to.
+        warnings.filterwarnings("ignore", message="The given NumPy array is not writable")
+        tensor = torch.from_numpy(data)
+
+    return tensor
+
+
+
+class ChunkedStorage(BaseStorage):
+    r"""Storage backed by a chunked and compressed ``.npc`` file.
+
+    Chunks are located through the chunk index, decompressed on demand and
+    kept in an LRU cache which is shared by all readers of the process
+    (see ``hypothesis.util.data.numpy.chunked``).
+    """
+
+    def __init__(self, path, cache=None):
+        super(ChunkedStorage, self).__init__()
+        # Check if the specified path exists.
+        if path is None or not os.path.exists(path):
+            raise ValueError("The path", path, "does not exists.")
+        if cache is None:
+            cache = chunked.cache
+        # Storage properties.
+        self.cache = cache
         self.fd = None
-        self.data_shape = self.header["shape"][1:]
-        self.data_type = self.header["descr"]
-        self.data_dimensionality = self._compute_dimensionality(self.data_shape)
-        self.data_bytes = int(self.data_type[-1]) * self.data_dimensionality
-        self.size = self.header["shape"][0]
+        self.path = path
+        self.pid = None
+        self.index = chunked.read_index(path)
+        self.chunk_size = self.index["chunk_size"]
+        self.dtype = self.index["dtype"]
+        self.shape = self.index["shape"]
+        self.size = self.shape[0]
+
+    def _open(self):
+        pid = os.getpid()
+        # Check if the file has to be opened in the current process.
+        if self.fd is None or self.pid != pid:
+            self.fd = os.open(self.path, os.O_RDONLY)
+            self.pid = pid
+
+        return self.fd
 
-    def _retrieve(self, index):
-        if self.fd is None:
-            self.fd = open(self.path, "rb")
-        self.fd.seek(self.offset + index * self.data_bytes)
-        data = np.fromfile(self.fd, dtype=self.data_type, count=self.data_dimensionality)
+    def _load_chunk(self, chunk):
+        offset = self.index["offsets"][chunk]
+        size = self.index["sizes"][chunk]
+        data = chunked.decompress(os.pread(self._open(), size, offset), self.index["codec"])
+        data = np.frombuffer(data, dtype=self.index["storage_dtype"])
 
-        return data.reshape(self.data_shape)
+        return data.reshape((-1,) + self.shape[1:])
+
+    def _chunk(self, chunk):
+        return self.cache.get((self.path, chunk), lambda: self._load_chunk(chunk))
 
     def close(self):
-        if hasattr(self, "fd") and self.fd is not None:
-            self.fd.close()
+        if getattr(self, "fd", None) is not None and self.pid == os.getpid():
+            os.close(self.fd)
         self.fd = None
+        self.pid = None
+
+    def _normalize(self, indices):
+        indices = np.asarray(indices, dtype=np.int64)
+        # Check if the indices are within the bounds of the storage.
+        if np.any((indices < -self.size) | (indices >= self.size)):
+            raise IndexError("Index out of bounds for a storage with", self.size, "rows.")
+
+        return np.where(indices < 0, indices + self.size, indices)
+
+    def get_batch(self, indices):
+        indices = self._normalize(indices)
+        chunks = indices // self.chunk_size
+        batch = np.empty((len(indices),) + self.shape[1:], dtype=self.dtype)
+        for chunk in np.unique(chunks):
+            selected = chunks == chunk
+            batch[selected] = self._chunk(chunk)[indices[selected] - chunk * self.chunk_size]
+
+        return torch.from_numpy(batch)
 
     def __getitem__(self, index):
-        return self._retrieve(index)
-        item = torch.from_numpy(data)
+        index = int(self._normalize(int(index)))
+        chunk = index // self.chunk_size
+        row = self._chunk(chunk)[index - chunk * self.chunk_size]
+
+        return as_tensor(np.asarray(row, dtype=self.dtype))
 
-        return item
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["fd"] = None # Opened again by the receiving process.
+        state["pid"] = None
+
+        return state
 
     def __len__(self):
         return self.size
 
-    @staticmethod
-    def _compute_dimensionality(shape):
-        dimensionality = 1
-        for size in shape:
-            dimensionality *= size
 
-        return dimensionality
 
-    @staticmethod
-    def _parse_header(fd):
-        r"""
-        Parses the ``numpy`` header of the specified file descriptor.
+class ShardedStorage(BaseStorage):
+    r"""Presents a set of ``.npy`` shards as a single storage, without
+    merging them.
+
+    The shards are specified by a glob pattern (or a list of paths) and
+    are concatenated along the first dimension in sorted order. Rows are
+    located by a binary search over the cumulative shard offsets, and the
+    shards themselves are opened by the specified storage type, which maps
+    persistent storages lazily.
+    """
+
+    def __init__(self, pattern, storage_type=PersistentStorage):
+        super(ShardedStorage, self).__init__()
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.paths = []
+        self.pattern = pattern
+        self.storages = []
+        self.storage_type = storage_type
+        self.refresh()
+        # Check if any shard has been found.
+        if len(self.storages) == 0:
+            raise ValueError("No shards match", pattern)
+
+    def _shards(self, indices):
+        return np.searchsorted(self.offsets, indices, side="right") - 1
+
+    def _normalize(self, indices):
+        indices = np.asarray(indices, dtype=np.int64)
+
+        return np.where(indices < 0, indices + len(self), indices)
+
+    def close(self):
+        if hasattr(self, "storages"):
+            for storage in self.storages:
+                storage.close()
+
+    def get_batch(self, indices):
+        indices = self._normalize(indices)
+        shards = self._shards(indices)
+        parts = []
+        positions = []
+        for shard in np.unique(shards):
+            selected = np.flatnonzero(shards == shard)
+            parts.append(self.storages[shard].get_batch(indices[selected] - self.offsets[shard]))
+            positions.append(selected)
+        batch = torch.cat(parts, dim=0)
+        # Restore the requested order if the indices span unsorted shards.
+        positions = np.concatenate(positions)
+        if np.any(np.diff(positions) < 0):
+            batch = batch[torch.from_numpy(np.argsort(positions))]
+
+        return batch
+
+    def refresh(self):
+        r"""Appends the shards which appeared since the previous refresh.
 
         Note:
-            * The first 6 bytes are a magic string: exactly \x93NUMPY.
-            * The next 1 byte is an unsigned byte: the major version number of the file format, e.g. \x01.
-            * The next 1 byte is an unsigned byte: the minor version number of the file format, e.g. \x00. Note: the version of the file format is not tied to the version of the numpy package.
-            * The next 2 bytes form a little-endian unsigned short int: the length of the header data HEADER_LEN.
+            New shards should sort after the existing ones, as the
+            rows of the existing shards are not renumbered.
         """
-        prefix = fd.read(10) # Read fixed header.
-        header_offset = int.from_bytes(prefix[-2:], byteorder="little")
-        header = eval(fd.read(header_offset)) # Not very secure but whatever.
-        header_offset += 10
+        if isinstance(self.pattern, str):
+            paths = sorted(glob.glob(self.pattern))
+        else:
+            paths = list(self.pattern)
+        known_paths = set(self.paths)
+        for path in paths:
+            if path not in known_paths:
+                storage = self.storage_type(path)
+                self.paths.append(path)
+                self.storages.append(storage)
+                self.offsets = np.append(self.offsets, self.offsets[-1] + len(storage))
+
+    def __getitem__(self, index):
+        index = int(self._normalize(index))
+        shard = int(self._shards(index))
+
+        return self.storages[shard][index - int(self.offsets[shard])]
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+
+
+def allocate_storage(path, in_memory=False):
+    r"""Allocates the storage of the specified path. Glob patterns and
+    lists of paths are presented as a single ``ShardedStorage``, and
+    ``.npc`` files are read through a ``ChunkedStorage``."""
+    if isinstance(path, str):
+        name = path
+    else:
+        name = path[0]
+    if name.endswith(chunked.extension):
+        storage_type = ChunkedStorage
+    elif in_memory:
+        storage_type = InMemoryStorage
+    else:
+        storage_type = PersistentStorage
+    if not isinstance(path, str) or glob.has_magic(path):
+        storage = ShardedStorage(path, storage_type=storage_type)
+    else:
+        storage = storage_type(path)
 
-        return header, header_offset
+    return storage
@@ -1,29 +1,139 @@
 import glob
+import io
 import numpy as np
 import os
-import tempfile as temp
+import struct
 import torch
 
+from concurrent.futures import ThreadPoolExecutor
+from numpy.lib import format
+
+
+
+def load_header(path):
+    r"""Reads the header of the specified ``.npy`` file.
+
+    Returns the shape, the Fortran-order flag, the data type and the offset
+    of the data in the file. The data itself is not read.
+    """
+    with open(path, "rb") as fd:
+        version = format.read_magic(fd)
+        if version == (1, 0):
+            shape, fortran_order, dtype = format.read_array_header_1_0(fd)
+        else:
+            shape, fortran_order, dtype = format.read_array_header_2_0(fd)
+        offset = fd.tell()
+
+    return shape, fortran_order, dtype, offset
 
 
 def compute_final_shape(file_names, axis=0):
-    num_files = len(file_names)
-    shape = list(np.load(file_names[0]).shape)
-    shape[axis] *= num_files
+    r"""Computes the shape of the concatenation of the specified files
+    along ``axis``, from their headers only. Files may differ in length
+    along ``axis``."""
+    shapes = [load_header(file_name)[0] for file_name in file_names]
+    shape = list(shapes[0])
+    for other in shapes[1:]:
+        if len(other) != len(shape) or any(a != b for dimension, (a, b) in enumerate(zip(shape, other)) if dimension != axis):
+            raise ValueError("Incompatible shapes", tuple(shape), other)
+    shape[axis] = sum(other[axis] for other in shapes)
 
     return tuple(shape)
 
 
-def merge(input_files, output_file, tempfile=None, dtype=None, in_memory=False, axis=0):
+def encode_header(shape, dtype, fortran_order=False, length=None):
+    r"""Encodes the ``.npy`` header of an array with the specified shape and
+    data type. If ``length`` is specified, the header is padded to exactly
+    that number of bytes, which allows a header to be rewritten in place."""
+    dtype = np.dtype(dtype)
+    header = {
+        "descr": format.dtype_to_descr(dtype),
+        "fortran_order": fortran_order,
+        "shape": tuple(shape)}
+    buffer = io.BytesIO()
+    try:
+        format.write_array_header_1_0(buffer, header)
+        size_format = "<H"
+    except ValueError: # Header does not fit a version 1.0 file.
+        format.write_array_header_2_0(buffer, header)
+        size_format = "<I"
+    encoded = buffer.getvalue()
+    if length is not None:
+        if len(encoded) > length:
+            raise ValueError("The header does not fit in", length, "bytes.")
+        prefix_length = format.MAGIC_LEN + struct.calcsize(size_format)
+        padding = b" " * (length - len(encoded))
+        encoded = encoded[:format.MAGIC_LEN] \
+            + struct.pack(size_format, length - prefix_length) \
+            + encoded[prefix_length:-1] + padding + b"\n"
+
+    return encoded
+
+
+def write_header(path, shape, dtype, fortran_order=False):
+    r"""Writes the ``.npy`` header of an array with the specified shape and
+    data type, and preallocates the file. Returns the offset of the data."""
+    dtype = np.dtype(dtype)
+    with open(path, "wb") as fd:
+        fd.write(encode_header(shape, dtype, fortran_order))
+        offset = fd.tell()
+        fd.truncate(offset + int(np.prod(shape)) * dtype.itemsize)
+
+    return offset
+
+
+def copy_range(source, destination, source_offset, destination_offset, size, buffer_size=64 * 2 ** 20):
+    r"""Copies ``size`` bytes between the specified file descriptors.
+
+    The copy is positional, i.e., it does not depend on the file offsets
+    of the descriptors, and is therefore safe to run concurrently on
+    disjoint ranges. ``os.copy_file_range`` is used whenever the platform
+    supports it, which avoids copying the data through user space.
+    """
+    while size > 0:
+        copied = 0
+        if hasattr(os, "copy_file_range"):
+            try:
+                copied = os.copy_file_range(source, destination, min(size, buffer_size),
+                    offset_src=source_offset, offset_dst=destination_offset)
+            except OSError: # Unsupported across file systems.
+                copied = 0
+        if copied == 0:
+            data = os.pread(source, min(size, buffer_size), source_offset)
+            if len(data) == 0:
+                raise EOFError("Unexpected end of file", source_offset)
+            copied = os.pwrite(destination, data, destination_offset)
+        source_offset += copied
+        destination_offset += copied
+        size -= copied
+
+
+def merge(input_files, output_file, dtype=None, in_memory=False, axis=0, workers=1):
+    r"""Concatenates the specified ``.npy`` files along ``axis``.
+
+    Shapes are derived from the file headers. Whenever the data of the
+    files can be concatenated byte-wise (C-ordered files merged along the
+    first axis without type conversion), the output header is written
+    first and every file is streamed into place, optionally by several
+    ``workers`` copying disjoint ranges concurrently. Otherwise, the files
+    are copied through memory maps. In both cases every byte is read and
+    written exactly once.
+    """
+    headers = [load_header(file_name) for file_name in input_files]
     # Compute the shape of the final data file.
     shape = compute_final_shape(input_files, axis=axis)
     # Check if a dtype needs to be derived.
     if dtype is None:
-        dtype = np.load(input_files[0]).dtype
+        dtype = headers[0][2]
+    dtype = np.dtype(dtype)
+    streamable = axis == 0 and all(not fortran_order and file_dtype == dtype
+        for _, fortran_order, file_dtype, _ in headers)
     if in_memory:
         merge_in_memory(input_files, output_file, shape=shape, dtype=dtype, axis=axis)
+    elif streamable:
+        merge_stream(input_files, output_file, shape=shape, dtype=dtype, workers=workers)
     else:
-        merge_on_disk(input_files, output_file, shape=shape, dtype=dtype, axis=axis, tempfile=tempfile)
+        merge_on_disk(input_files, output_file, shape=shape, dtype=dtype, axis=axis)
 
 
 def merge_in_memory(input_files, output_file, shape, dtype=None, axis=0):
@@ -32,22 +142,117 @@ def merge_in_memory(input_files, output_file, shape, dtype=None, axis=0):
     np.save(output_file, datamap)
 
 
-def merge_on_disk(input_files, output_file, shape, dtype=None, axis=0, tempfile=None):
-    # Check if a random temporary file needs to be allocated.
-    if tempfile is None:
-        _, tempfile = temp.mkstemp(dir='.')
-    datamap = np.memmap(tempfile, dtype=dtype, mode="w+", shape=shape)
+def merge_on_disk(input_files, output_file, shape, dtype=None, axis=0):
+    datamap = format.open_memmap(output_file, mode="w+", dtype=dtype, shape=shape)
     insert_data(input_files, datamap, axis=axis)
-    np.save(output_file, datamap)
-    os.remove(tempfile)
+    datamap.flush()
+    del datamap
+
+
+def merge_stream(input_files, output_file, shape, dtype, workers=1):
+    destination_offset = write_header(output_file, shape, dtype)
+    tasks = []
+    for file_name in input_files:
+        file_shape, _, _, source_offset = load_header(file_name)
+        size = int(np.prod(file_shape)) * dtype.itemsize
+        tasks.append((file_name, source_offset, destination_offset, size))
+        destination_offset += size
+    destination = os.open(output_file, os.O_WRONLY)
+    try:
+        def copy(task):
+            file_name, source_offset, destination_offset, size = task
+            source = os.open(file_name, os.O_RDONLY)
+            try:
+                copy_range(source, destination, source_offset, destination_offset, size)
+            finally:
+                os.close(source)
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(copy, tasks))
+        else:
+            for task in tasks:
+                copy(task)
+    finally:
+        os.close(destination)
 
 
 def insert_data(input_files, datamap, axis=0):
     index = 0
     if axis > 0:
-        datamap = np.rollaxis(datamap, axis)
+        datamap = np.moveaxis(datamap, axis, 0)
     for file_name in input_files:
-        data = np.load(file_name)
+        data = np.load(file_name, mmap_mode="r")
+        if axis > 0:
+            data = np.moveaxis(data, axis, 0)
         num_rows = data.shape[0]
-        datamap[index:index + num_rows, :] = data
+        datamap[index:index + num_rows] = data
         index += num_rows
+
+
+def finite_rows(block):
+    r"""Row predicate selecting the rows without NaN or infinite values."""
+    return np.isfinite(block.reshape(len(block), -1)).all(axis=1)
+
+
+def prune(input_file, output_file, indices=None, axis=1, predicate=None, rows=None, chunk_size=10000, in_memory=False):
+    r"""Removes the specified ``indices`` along ``axis`` from a ``.npy`` file.
+
+    The file is processed in blocks of ``chunk_size`` rows through a memory
+    map, which bounds the memory usage independently of the file size.
+    Rows can be filtered in the same pass, either by a ``predicate`` which
+    maps a (pruned) block to a boolean mask of the rows to keep, or by a
+    boolean mask ``rows`` over the complete file. Returns the boolean mask
+    of the rows which have been kept, e.g., to prune a paired file
+    consistently.
+    """
+    if in_memory:
+        mmap_mode = None
+    else:
+        mmap_mode = "r"
+    data = np.load(input_file, mmap_mode=mmap_mode)
+    if indices is None:
+        indices = []
+    # Check if the axis of the indices exists, wrapping it around would
+    # remove other entries (e.g., rows instead of features).
+    if len(indices) > 0 and not -data.ndim <= axis < data.ndim:
+        raise ValueError("The specified axis (", axis, ") does not exist in a file with", data.ndim, "dimensions.")
+    axis = axis % data.ndim
+    indices = np.asarray(indices, dtype=np.int64)
+    n = data.shape[axis]
+    # Check if the indices exist, wrapping them around would remove other
+    # entries without notice.
+    if np.any((indices < -n) | (indices >= n)):
+        raise IndexError("The indices", indices[(indices < -n) | (indices >= n)].tolist(), "are out of bounds for axis", axis, "with size", n)
+    indices = np.unique(indices % n)
+    # Compute an upper bound of the output shape, the header is rewritten
+    # with the exact number of rows once all blocks have been written.
+    shape = list(data.shape)
+    shape[axis] -= len(indices)
+    offset = write_header(output_file, shape, data.dtype)
+    num_rows = 0
+    kept = np.zeros(len(data), dtype=bool)
+    with open(output_file, "r+b") as fd:
+        fd.seek(offset)
+        for start in range(0, len(data), chunk_size):
+            end = min(start + chunk_size, len(data))
+            block = np.asarray(data[start:end])
+            mask = np.ones(end - start, dtype=bool)
+            if axis == 0:
+                mask &= ~np.isin(np.arange(start, end), indices)
+            elif len(indices) > 0:
+                block = np.delete(block, indices, axis=axis)
+            if rows is not None:
+                mask &= rows[start:end]
+            if predicate is not None:
+                mask &= predicate(block)
+            block = np.ascontiguousarray(block[mask])
+            fd.write(block.tobytes())
+            kept[start:end] = mask
+            num_rows += len(block)
+        shape[0] = num_rows
+        fd.truncate(fd.tell())
+        fd.seek(0)
+        fd.write(encode_header(shape, data.dtype, length=offset))
+    del data
+
+    return kept
@@ -15,5 +15,8 @@ class SimulationTensorDataset(Dataset):
     def __getitem__(self, index):
         return self.inputs[index], self.outputs[index]
 
+    def get_batch(self, indices):
+        return self.inputs[indices], self.outputs[indices]
+
     def __len__(self):
         return self.inputs.shape[0]
@@ -1,7 +1,16 @@
+import hypothesis
+import numpy as np
+import random
 import torch
 
 from hypothesis.simulation import Simulator
+from hypothesis.simulation.util import sample_joint
+from hypothesis.util.general import distributed_rank_and_world_size
+from hypothesis.util.general import rng_state
+from hypothesis.util.general import set_rng_state
 from torch.utils.data import Dataset
+from torch.utils.data import IterableDataset
+from torch.utils.data import get_worker_info
 
 
 
@@ -40,3 +49,115 @@ class SimulatorDataset(Dataset):
             Write docs.
         """
         return self.size
+
+
+
+class BatchSimulatorDataset(IterableDataset):
+    r"""Yields complete batches of fresh simulations.
+
+    Every batch is obtained by a single call of the (batched) simulator on
+    ``batch_size`` samples of the prior, and should be loaded with
+    ``batch_size=None``. An epoch consists of ``size // batch_size``
+    batches, which are distributed over the distributed ranks and their
+    data loader workers. All ranks simulate the same number of batches,
+    the length of the dataset is the number of batches of a rank. Every
+    worker seeds the random number generators of torch, numpy and Python
+    independently, optionally derived from ``seed``. Without workers, the
+    seeded random state is kept by the dataset, and the random state of
+    the caller is left untouched.
+
+    If ``replay`` is larger than 1, the simulations of an epoch are
+    buffered and reused (in a different order) for ``replay`` epochs. As
+    the buffers live in the workers, they require persistent workers.
+
+    :param simulator: The simulator.
+    :param prior: The prior from which the inputs are drawn.
+    :param batch_size: Number of simulations per batch, should match the
+                       batch size of the trainer.
+    :param size: Number of simulations per epoch.
+    :param replay: Number of epochs every simulation is used for.
+    :param seed: Base seed of the workers (default: seeded by torch).
+    """
+
+    def __init__(self, simulator, prior, batch_size=hypothesis.default.batch_size, size=1000000, replay=1, seed=None):
+        super(BatchSimulatorDataset, self).__init__()
+        self.batch_size = batch_size
+        self.buffer = []
+        self.epoch = 0
+        self.prior = prior
+        self.random_state = None
+        self.replay = replay
+        self.seed = seed
+        self.simulator = simulator
+        self.size = int(size)
+
+    def _seed(self, worker_id):
+        # Check if the random state has to be initialized (once per worker).
+        if self.epoch > 0:
+            return
+        worker = get_worker_info()
+        rank, _ = distributed_rank_and_world_size()
+        if self.seed is not None:
+            seed = int(np.random.SeedSequence([self.seed, rank, worker_id]).generate_state(1)[0])
+        elif worker is not None:
+            seed = worker.seed % 2 ** 32 # Distinct for every worker.
+        else:
+            return # Use the global random state.
+        # Check if the seeded state has to be kept apart from the caller.
+        if worker is None:
+            state = rng_state()
+            self._seed_global(seed)
+            self.random_state = rng_state()
+            set_rng_state(state)
+        else:
+            self._seed_global(seed)
+
+    def _seed_global(self, seed):
+        random.seed(seed)
+        np.random.seed(seed)
+        torch.manual_seed(seed)
+
+    def _random(self, function):
+        if self.random_state is None:
+            return function()
+        # Evaluate the function with the random state of the dataset.
+        state = rng_state()
+        set_rng_state(self.random_state)
+        try:
+            return function()
+        finally:
+            self.random_state = rng_state()
+            set_rng_state(state)
+
+    def _worker_batches(self):
+        worker = get_worker_info()
+        if worker is None:
+            worker_id, num_workers = 0, 1
+        else:
+            worker_id, num_workers = worker.id, worker.num_workers
+        # The batches of the rank are distributed over its workers.
+        num_batches = len(range(worker_id, len(self), num_workers))
+
+        return worker_id, num_batches
+
+    @torch.no_grad()
+    def __iter__(self):
+        worker_id, num_batches = self._worker_batches()
+        self._seed(worker_id)
+        # Check if the buffered simulations can be replayed.
+        if self.replay > 1 and self.epoch % self.replay != 0:
+            for index in self._random(lambda: torch.randperm(len(self.buffer))).tolist():
+                yield self.buffer[index]
+        else:
+            self.buffer = []
+            for _ in range(num_batches):
+                inputs, outputs = self._random(lambda: sample_joint(self.simulator, self.prior, n=self.batch_size))
+                if self.replay > 1:
+                    self.buffer.append((inputs, outputs))
+                yield inputs, outputs
+        self.epoch += 1
+
+    def __len__(self):
+        _, world_size = distributed_rank_and_world_size()
+
+        return self.size // self.batch_size // world_size
@@ -2,9 +2,47 @@ r"""General utilities for Hypothesis."""
 
 import hypothesis
 import numpy as np
+import random
 import torch
 
 
 
 def is_iterable(item):
     return hasattr(item, "__getitem__")
+
+
+def load_class(full_classname):
+    r"""Loads the class (or any attribute) with the specified fully
+    qualified name, e.g., ``hypothesis.benchmark.normal.Prior``."""
+    if full_classname is None:
+        raise ValueError("The specified classname cannot be `None`.")
+    module_name, class_name = full_classname.rsplit('.', 1)
+    module = __import__(module_name, fromlist=[class_name])
+
+    return getattr(module, class_name)
+
+
+def distributed_rank_and_world_size():
+    if torch.distributed.is_available() and torch.distributed.is_initialized():
+        return torch.distributed.get_rank(), torch.distributed.get_world_size()
+    else:
+        return 0, 1
+
+
+def rng_state():
+    state = {
+        "numpy": np.random.get_state(),
+        "python": random.getstate(),
+        "torch": torch.get_rng_state()}
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.get_rng_state_all()
+
+    return state
+
+
+def set_rng_state(state):
+    np.random.set_state(state["numpy"])
+    random.setstate(state["python"])
+    torch.set_rng_state(state["torch"])
+    if "cuda" in state.keys() and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])